@@ -1,7 +1,6 @@
 from pywb.utils.canonicalize import calc_search_range
 from pywb.cdx.cdxobject import CDXObject
 from pywb.warc.cdxindexer import write_cdx_index
-from pywb.utils.timeutils import iso_date_to_timestamp
 
 from io import BytesIO
 import os
@@ -9,6 +8,8 @@ import os
 from webagg.indexsource import RedisIndexSource
 from webagg.aggregator import SimpleAggregator
 from webagg.utils import res_template
+from webagg.dateutils import iso_date_to_timestamp
+from webagg.responseloader import RedisDigestIndex, RedisResolver
 
 from recorder.filters import WriteRevisitDupePolicy
 
@@ -30,6 +31,7 @@ class WritableRedisIndexer(RedisIndexSource):
         self.rel_path_template = kwargs.get('rel_path_template', '')
         self.file_key_template = kwargs.get('file_key_template', '')
         self.full_warc_prefix = kwargs.get('full_warc_prefix', '')
+        self.digest_key_template = kwargs.get('digest_key_template', '')
         self.dupe_policy = kwargs.get('dupe_policy', WriteRevisitDupePolicy())
 
     def add_warc_file(self, full_filename, params):
@@ -42,6 +44,9 @@ class WritableRedisIndexer(RedisIndexSource):
 
         self.redis.hset(file_key, rel_filename, full_load_path)
 
+        self.redis.publish(RedisResolver.UPDATE_CHANNEL,
+                           RedisResolver.make_update(file_key, rel_filename))
+
     def add_urls_to_index(self, stream, params, filename, length):
         rel_path = res_template(self.rel_path_template, params)
         filename = os.path.relpath(filename, rel_path)
@@ -54,12 +59,33 @@ class WritableRedisIndexer(RedisIndexSource):
 
         cdx_list = cdxout.getvalue().rstrip().split(b'\n')
 
+        digest_key = None
+        if self.digest_key_template:
+            digest_key = res_template(self.digest_key_template, params)
+
         for cdx in cdx_list:
             if cdx:
                 self.redis.zadd(z_key, 0, cdx)
 
+                if digest_key:
+                    self.add_digest(digest_key, CDXObject(cdx))
+
         return cdx_list
 
+    def add_digest(self, digest_key, cdx):
+        """ Add location of original record for this payload digest,
+        keeping the first original
+        """
+        digest = cdx.get('digest', '-')
+        if digest == '-' or cdx.get('mime') == 'warc/revisit':
+            return
+
+        location = RedisDigestIndex.to_location(cdx['filename'],
+                                                cdx['offset'],
+                                                cdx['length'])
+
+        self.redis.hsetnx(digest_key, digest.split(':')[-1], location)
+
     def lookup_revisit(self, params, digest, url, iso_dt):
         params['url'] = url
         params['closest'] = iso_date_to_timestamp(iso_dt)
@@ -62,6 +62,7 @@ class TestRecorder(LiveServerTests, FakeRedisTests, TempDirTests, BaseTestClass)
 
         dedup_index = WritableRedisIndexer(redis_url=redis_url,
                         file_key_template=file_key_template,
+                        digest_key_template=file_key_template.replace(':warc', ':digests'),
                         rel_path_template=self.root_dir + '/warcs/',
                         dupe_policy=dupe_policy)
 
@@ -233,6 +234,9 @@ class TestRecorder(LiveServerTests, FakeRedisTests, TempDirTests, BaseTestClass)
         full_path = self.root_dir + '/warcs/' + cdx['filename']
         assert warcs == {cdx['filename'].encode('utf-8'): full_path.encode('utf-8')}
 
+        location = cdx['filename'] + ' 0 ' + cdx['length']
+        assert r.hget('USER:COLL:digests', cdx['digest']) == location.encode('utf-8')
+
     def test_record_param_user_coll_same_dir(self):
         warc_path = to_path(self.root_dir + '/warcs2/')
 
@@ -6,7 +6,6 @@ from pywb.rewrite.url_rewriter import UrlRewriter
 
 from pywb.utils.wbexception import WbException
 from pywb.utils.canonicalize import canonicalize
-from pywb.utils.timeutils import http_date_to_timestamp
 from pywb.utils.loaders import extract_client_cookie
 
 from pywb.cdx.cdxobject import CDXObject
@@ -15,6 +14,8 @@ from pywb.framework.wbrequestresponse import WbResponse
 
 from six.moves.urllib.parse import urlencode
 
+from webagg.dateutils import http_date_to_timestamp
+
 from urlrewrite.rewriteinputreq import RewriteInputRequest
 from urlrewrite.templateview import JinjaEnv, HeadInsertView, TopFrameView, BaseInsertView
 
@@ -38,10 +38,23 @@ class BaseAggregator(object):
 
         cdx_iter, errs = self.load_index(query.params)
 
+        stats = params.get('_stats')
+        if stats:
+            cdx_iter = stats.timed_iter(cdx_iter, 'merge')
+
         cdx_iter = process_cdx(cdx_iter, query)
+
+        if stats:
+            cdx_iter = stats.timed_iter(cdx_iter, 'process_cdx')
+
         return cdx_iter, dict(errs)
 
     def load_child_source(self, name, source, params):
+        stats = params.get('_stats')
+        if stats:
+            params, src_stats = stats.enter_source(name, params)
+            start = time.time()
+
         try:
             params['_formatter'] = ParamFormatter(params, name)
             res = source.load_index(params)
@@ -55,6 +68,10 @@ class BaseAggregator(object):
             cdx_iter = iter([])
             err_list = [(name, repr(wbe))]
 
+        if stats:
+            src_stats['load_time'] += time.time() - start
+            cdx_iter = stats.source_iter(cdx_iter, src_stats)
+
         def add_name(cdx, name):
             if cdx.get('source'):
                 cdx['source'] = name + ':' + cdx['source']
@@ -197,6 +214,10 @@ class GeventMixin(object):
                 results.append((iter([]), [(name, 'timeout')]))
                 self._on_source_error(name)
 
+                stats = params.get('_stats')
+                if stats:
+                    stats.get_source(stats.full_name(params, name))['timeout'] = True
+
         return results
 
 
@@ -1,4 +1,5 @@
 from webagg.inputrequest import DirectWSGIInputRequest, POSTInputRequest
+from webagg.utils import FileRange, BUFF_SIZE
 from werkzeug.routing import Map, Rule
 
 import requests
@@ -17,6 +18,10 @@ class ResAggApp(object):
         self.route_dict = {}
         self.debug = kwargs.get('debug', False)
 
+        # serve local file ranges with wsgi.file_wrapper, only for servers
+        # which send from the current file position up to Content-Length
+        self.sendfile = kwargs.get('sendfile', False)
+
         self.url_map = Map()
 
         def list_routes(environ):
@@ -78,6 +83,15 @@ class ResAggApp(object):
                     errs['last_exc'] = str(errs['last_exc'])
                 out_headers['ResErrors'] = json.dumps(errs)
 
+            file_wrapper = environ.get('wsgi.file_wrapper')
+
+            if self.sendfile and file_wrapper and isinstance(res, FileRange):
+                write = start_response('200 OK', list(out_headers.items()))
+                if res.header:
+                    write(res.header)
+
+                return file_wrapper(res, BUFF_SIZE)
+
             start_response('200 OK', list(out_headers.items()))
             return res
 
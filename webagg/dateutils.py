@@ -0,0 +1,177 @@
+from pywb.utils.timeutils import timestamp_to_http_date as _timestamp_to_http_date
+from pywb.utils.timeutils import http_date_to_timestamp as _http_date_to_timestamp
+from pywb.utils.timeutils import iso_date_to_timestamp as _iso_date_to_timestamp
+from pywb.utils.timeutils import timestamp_to_iso_date as _timestamp_to_iso_date
+
+from collections import OrderedDict
+
+import datetime
+
+
+WEEKDAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+
+MONTHS = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun',
+          'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+
+MONTH_NUMS = dict((name, '{0:02d}'.format(i + 1)) for i, name in enumerate(MONTHS))
+
+
+#=============================================================================
+class DateCache(object):
+    """ Small LRU memo of the date part of a conversion, keyed on the
+    date prefix of the input (eg. '20131226'), as many captures share
+    the same day. The time of day is converted without lookups.
+    """
+    def __init__(self, max_size=4096):
+        self.max_size = max_size
+        self.cache = OrderedDict()
+
+    def get(self, key):
+        value = self.cache.pop(key, None)
+        if value is not None:
+            self.cache[key] = value
+
+        return value
+
+    def put(self, key, value):
+        while len(self.cache) >= self.max_size:
+            self.cache.popitem(last=False)
+
+        self.cache[key] = value
+
+
+TS_DATES = DateCache()
+TS_ISO_DATES = DateCache()
+HTTP_DATES = DateCache()
+
+
+#=============================================================================
+def _valid_time(hh, mm, ss):
+    return hh < '24' and mm < '60' and ss < '60'
+
+
+def _ts_date(date):
+    """ 'YYYYMMDD' -> datetime.date, or None if not a valid date
+    """
+    try:
+        dt = datetime.date(int(date[0:4]), int(date[4:6]), int(date[6:8]))
+    except ValueError:
+        return None
+
+    # timestamp_to_datetime() clamps years out of this range
+    if dt.year < 1900 or dt.year > 2999:
+        return None
+
+    return dt
+
+
+def _ts_date_to_http(date):
+    """ 'YYYYMMDD' -> 'Thu, 26 Dec 2013'
+    """
+    dt = _ts_date(date)
+    if not dt:
+        return None
+
+    return '{0}, {1} {2} {3}'.format(WEEKDAYS[dt.weekday()], date[6:8],
+                                     MONTHS[dt.month - 1], date[0:4])
+
+
+def _ts_date_to_iso(date):
+    """ 'YYYYMMDD' -> '2013-12-26'
+    """
+    if not _ts_date(date):
+        return None
+
+    return date[0:4] + '-' + date[4:6] + '-' + date[6:8]
+
+
+def _convert_ts(string, cache, convert_date, time_sep, time_end):
+    if len(string) < 14 or not string[:14].isdigit():
+        return None
+
+    hh, mm, ss = string[8:10], string[10:12], string[12:14]
+    if not _valid_time(hh, mm, ss):
+        return None
+
+    date = string[:8]
+    res = cache.get(date)
+    if res is None:
+        res = convert_date(date)
+        if res is None:
+            return None
+
+        cache.put(date, res)
+
+    return res + time_sep + hh + ':' + mm + ':' + ss + time_end
+
+
+def _http_date_to_ts_date(date):
+    """ '26 Dec 2013' -> '20131226', or None if not a valid date
+    """
+    day, month, year = date[0:2], MONTH_NUMS.get(date[3:6]), date[7:11]
+    if not month:
+        return None
+
+    try:
+        datetime.date(int(year), int(month), int(day))
+    except ValueError:
+        return None
+
+    return year + month + day
+
+
+#=============================================================================
+def timestamp_to_http_date(string):
+    """ Memoized timestamp_to_http_date(), partial or invalid
+    timestamps are padded and clamped as before
+    """
+    return (_convert_ts(string, TS_DATES, _ts_date_to_http, ' ', ' GMT') or
+            _timestamp_to_http_date(string))
+
+
+def timestamp_to_iso_date(string):
+    """ Memoized timestamp_to_iso_date(), partial or invalid
+    timestamps are padded and clamped as before
+    """
+    return (_convert_ts(string, TS_ISO_DATES, _ts_date_to_iso, 'T', 'Z') or
+            _timestamp_to_iso_date(string))
+
+
+def http_date_to_timestamp(string):
+    """ Memoized http_date_to_timestamp() for the fixed
+    'Thu, 26 Dec 2013 09:50:00 GMT' format, other formats are
+    parsed as before
+    """
+    if len(string) == 29 and string.endswith(' GMT') and string[19] == ':':
+        date = string[5:16]
+        timestamp = HTTP_DATES.get(date)
+        if timestamp is None:
+            timestamp = _http_date_to_ts_date(date)
+            if timestamp is not None:
+                HTTP_DATES.put(date, timestamp)
+
+        hh, mm, ss = string[17:19], string[20:22], string[23:25]
+        if (timestamp is not None and (hh + mm + ss).isdigit() and
+            _valid_time(hh, mm, ss)):
+            return timestamp + hh + mm + ss
+
+    return _http_date_to_timestamp(string)
+
+
+def iso_date_to_timestamp(string):
+    """ Fast iso_date_to_timestamp() for the 'YYYY-MM-DDTHH:MM:SSZ'
+    format of WARC-Date, other formats are parsed as before
+    """
+    if len(string) == 20 and string[4] == '-' and string[10] == 'T':
+        timestamp = (string[0:4] + string[5:7] + string[8:10] +
+                     string[11:13] + string[14:16] + string[17:19])
+        if timestamp.isdigit():
+            return timestamp
+
+    return _iso_date_to_timestamp(string)
+
+
+def iso_date_to_http_date(string):
+    """ WARC-Date to Memento-Datetime
+    """
+    return timestamp_to_http_date(iso_date_to_timestamp(string))
@@ -0,0 +1,176 @@
+from collections import OrderedDict
+
+import time
+
+
+#=============================================================================
+class QueryStats(object):
+    """ Per-query instrumentation, enabled with the 'explain' param
+
+    Stored in params['_stats'] and only consulted when present, so
+    the normal query path pays a single dict lookup per stage.
+    """
+    SOURCE_FIELDS = ('lines_scanned', 'lines_returned', 'bytes_read',
+                     'cache_hits', 'cache_misses')
+
+    def __init__(self):
+        self.start = time.time()
+        self.end = None
+        self.lines = 0
+
+        self.sources = OrderedDict()
+        self.stages = dict(merge=0.0,
+                           process_cdx=0.0,
+                           fuzzy_call=0.0,
+                           fuzzy_iter=0.0,
+                           output=0.0)
+
+        self.loaders = OrderedDict()
+
+    def get_source(self, name):
+        src = self.sources.get(name)
+        if src is None:
+            src = dict((field, 0) for field in self.SOURCE_FIELDS)
+            src['load_time'] = 0.0
+            src['iter_time'] = 0.0
+            src['timeout'] = False
+            self.sources[name] = src
+
+        return src
+
+    def full_name(self, params, name):
+        parent = params.get('_src_name')
+        if parent:
+            return parent + ':' + name
+        else:
+            return name
+
+    def enter_source(self, name, params):
+        """ Return a copy of params for loading child source 'name',
+        tracking nested source names and the stats for that source
+        """
+        name = self.full_name(params, name)
+        src = self.get_source(name)
+        params = dict(params)
+        params['_src_name'] = name
+        params['_src_stats'] = src
+        return params, src
+
+    def add_stage(self, stage, elapsed):
+        self.stages[stage] += elapsed
+
+    def timed_iter(self, iter_, stage):
+        iter_ = iter(iter_)
+        while True:
+            start = time.time()
+            try:
+                value = next(iter_)
+            except StopIteration:
+                return
+            finally:
+                self.stages[stage] += time.time() - start
+
+            yield value
+
+    def source_iter(self, cdx_iter, src):
+        cdx_iter = iter(cdx_iter)
+        while True:
+            start = time.time()
+            try:
+                cdx = next(cdx_iter)
+            except StopIteration:
+                return
+            finally:
+                src['iter_time'] += time.time() - start
+
+            src['lines_scanned'] += 1
+            yield cdx
+
+    def returned_iter(self, cdx_iter):
+        for cdx in cdx_iter:
+            self.lines += 1
+            name = ''
+            for part in cdx.get('source', '').split(':'):
+                name = name + ':' + part if name else part
+                src = self.sources.get(name)
+                if src is not None:
+                    src['lines_returned'] += 1
+
+            yield cdx
+
+    def add_loader(self, name, elapsed):
+        self.loaders[name] = self.loaders.get(name, 0.0) + elapsed
+
+    def finish(self):
+        self.end = time.time()
+
+    @staticmethod
+    def _ms(secs):
+        return round(max(secs, 0.0) * 1000.0, 3)
+
+    def _top_level_iter_time(self):
+        return sum(src['iter_time'] for name, src in self.sources.items()
+                   if ':' not in name)
+
+    def get_stage_times(self):
+        """ Return exclusive time spent in each stage, derived from the
+        inclusive time recorded for each nested iterator
+        """
+        stages = self.stages
+        fuzzy = stages['fuzzy_call'] + stages['fuzzy_iter']
+
+        res = OrderedDict()
+        res['merge'] = stages['merge'] - self._top_level_iter_time()
+        res['process_cdx'] = stages['process_cdx'] - stages['merge']
+        res['fuzzy'] = fuzzy
+        res['serialize'] = (stages['output'] - stages['process_cdx'] -
+                            stages['fuzzy_call'])
+
+        return res
+
+    def to_dict(self):
+        end = self.end or time.time()
+
+        sources = OrderedDict()
+        for name, src in self.sources.items():
+            res = OrderedDict()
+            res['wall_time'] = self._ms(src['load_time'] + src['iter_time'])
+            for field in self.SOURCE_FIELDS:
+                res[field] = src[field]
+            res['timeout'] = src['timeout']
+            sources[name] = res
+
+        stages = OrderedDict((stage, self._ms(value)) for stage, value in
+                             self.get_stage_times().items())
+
+        result = OrderedDict()
+        result['total_time'] = self._ms(end - self.start)
+        result['lines'] = self.lines
+        result['stages'] = stages
+        result['sources'] = sources
+
+        if self.loaders:
+            result['loaders'] = OrderedDict((name, self._ms(value))
+                                for name, value in self.loaders.items())
+
+        return result
+
+    def to_server_timing(self):
+        end = self.end or time.time()
+
+        entries = ['total;dur={0}'.format(self._ms(end - self.start))]
+
+        for stage, value in self.get_stage_times().items():
+            entries.append('{0};dur={1}'.format(stage.replace('_', '-'),
+                                                self._ms(value)))
+
+        for name, src in self.sources.items():
+            entries.append('source;desc="{0}";dur={1}'.format(
+                           name.replace('"', ''),
+                           self._ms(src['load_time'] + src['iter_time'])))
+
+        for name, value in self.loaders.items():
+            entries.append('load;desc="{0}";dur={1}'.format(name,
+                                                            self._ms(value)))
+
+        return ', '.join(entries)
@@ -0,0 +1,185 @@
+from pywb.utils.loaders import BlockLoader
+
+from six.moves.urllib.request import url2pathname
+from collections import OrderedDict
+
+import os
+import stat
+import threading
+
+
+#=============================================================================
+class PooledFile(object):
+    def __init__(self, path, fd):
+        self.path = path
+        self.fd = fd
+
+        st = os.fstat(fd)
+        self.ident = (st.st_dev, st.st_ino)
+
+        self.refs = 0
+        self.evicted = False
+
+
+#=============================================================================
+class FilePool(object):
+    """ Bounded, process-wide pool of open read-only file descriptors,
+    keyed by path and evicted by LRU
+
+    Readers share a descriptor and only use positional reads, so no
+    seek position is shared between them. A pooled descriptor is
+    reopened if the path now refers to a different file, eg. a WARC
+    replaced by rename. Evicted descriptors are closed once the last
+    reader using them is closed.
+    """
+    def __init__(self, max_open=256):
+        self.max_open = max_open
+        self.files = OrderedDict()
+        self.lock = threading.RLock()
+
+    def acquire(self, path):
+        st = os.stat(path)
+        if not stat.S_ISREG(st.st_mode):
+            raise IOError('Not a file: ' + path)
+
+        ident = (st.st_dev, st.st_ino)
+
+        with self.lock:
+            pfile = self.files.pop(path, None)
+            if pfile and pfile.ident != ident:
+                self._evict(pfile)
+                pfile = None
+
+            if not pfile:
+                pfile = PooledFile(path, os.open(path, os.O_RDONLY | getattr(os, 'O_BINARY', 0)))
+
+            self.files[path] = pfile
+            pfile.refs += 1
+
+            while len(self.files) > self.max_open:
+                _, old = self.files.popitem(last=False)
+                self._evict(old)
+
+        return pfile
+
+    def release(self, pfile):
+        with self.lock:
+            pfile.refs -= 1
+            if pfile.evicted and pfile.refs == 0:
+                os.close(pfile.fd)
+
+    def _evict(self, pfile):
+        pfile.evicted = True
+        if pfile.refs == 0:
+            os.close(pfile.fd)
+
+    def clear(self):
+        with self.lock:
+            while self.files:
+                _, pfile = self.files.popitem()
+                self._evict(pfile)
+
+    def open(self, path, offset=0, length=-1):
+        return PooledFileReader(self, self.acquire(path), offset, length)
+
+
+WARC_FILE_POOL = FilePool()
+
+
+#=============================================================================
+class PooledFileReader(object):
+    """ Reader for a range of a pooled file, using os.pread()
+    """
+    def __init__(self, pool, pfile, offset, length=-1):
+        self.pool = pool
+        self.pfile = pfile
+        self.pos = offset
+
+        if length < 0:
+            self.end = os.fstat(pfile.fd).st_size
+        else:
+            self.end = offset + length
+
+    def read(self, size=-1):
+        remaining = self.end - self.pos
+        if size is None or size < 0 or size > remaining:
+            size = remaining
+
+        if size <= 0 or not self.pfile:
+            return b''
+
+        buff = os.pread(self.pfile.fd, size, self.pos)
+        self.pos += len(buff)
+        return buff
+
+    def readline(self, size=-1):
+        remaining = self.end - self.pos
+        if size is None or size < 0 or size > remaining:
+            size = remaining
+
+        line = b''
+
+        while self.pfile and len(line) < size:
+            buff = os.pread(self.pfile.fd, min(size - len(line), 1024),
+                            self.pos + len(line))
+            if not buff:
+                break
+
+            end = buff.find(b'\n')
+            if end >= 0:
+                line += buff[:end + 1]
+                break
+
+            line += buff
+
+        self.pos += len(line)
+        return line
+
+    def close(self):
+        if self.pfile:
+            self.pool.release(self.pfile)
+            self.pfile = None
+
+    def __del__(self):
+        self.close()
+
+
+#=============================================================================
+class PooledBlockLoader(BlockLoader):
+    """ BlockLoader which loads local files through a FilePool, and
+    http(s) urls through a RemoteWARCStore, if set. Other urls are
+    loaded as before
+    """
+    def __init__(self, pool=None, remote_store=None, **kwargs):
+        super(PooledBlockLoader, self).__init__(**kwargs)
+        self.pool = pool or WARC_FILE_POOL
+        self.remote_store = remote_store
+
+    @staticmethod
+    def get_local_path(url):
+        if url.startswith('file://'):
+            return url2pathname(url[len('file://'):])
+
+        if '://' not in url:
+            return url
+
+        return None
+
+    def load(self, url, offset=0, length=-1):
+        if self.remote_store and url.startswith(('http://', 'https://')):
+            return self.remote_store.open(url, offset, length)
+
+        # positional reads not available (py2)
+        if not hasattr(os, 'pread'):  #pragma: no cover
+            return super(PooledBlockLoader, self).load(url, offset, length)
+
+        path = self.get_local_path(url)
+        if path is None:
+            return super(PooledBlockLoader, self).load(url, offset, length)
+
+        try:
+            return self.pool.open(path, offset, length)
+        except OSError:
+            # not found or not a file, report error or load
+            # package resource as before
+            return super(PooledBlockLoader, self).load(url, offset, length)
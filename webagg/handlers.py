@@ -1,5 +1,7 @@
 from webagg.responseloader import  WARCPathLoader, LiveWebLoader, VideoLoader
+from webagg.responseloader import CachingLoader
 from webagg.utils import MementoUtils
+from webagg.explain import QueryStats
 from pywb.utils.wbexception import BadRequestException, WbException
 from pywb.utils.wbexception import NotFoundException
 
@@ -7,6 +9,7 @@ from pywb.cdx.query import CDXQuery
 from pywb.cdx.cdxdomainspecific import load_domain_specific_cdx_rules
 
 import six
+import time
 
 
 #=============================================================================
@@ -54,8 +57,16 @@ class FuzzyMatcher(object):
 
         fuzzy_query_params.pop('alt_url', '')
 
+        stats = params.get('_stats')
+        if stats:
+            start = time.time()
+
         new_iter, errs = index_source(fuzzy_query_params)
 
+        if stats:
+            stats.add_stage('fuzzy_call', time.time() - start)
+            new_iter = stats.timed_iter(new_iter, 'fuzzy_iter')
+
         for cdx in new_iter:
             yield cdx
 
@@ -89,7 +100,19 @@ class IndexHandler(object):
         if input_req:
             params['alt_url'] = input_req.include_post_query(url)
 
-        return self.fuzzy(self.index_source, params)
+        cdx_iter, errs = self.fuzzy(self.index_source, params)
+
+        stats = params.get('_stats')
+        if stats and cdx_iter:
+            cdx_iter = stats.returned_iter(cdx_iter)
+
+        return cdx_iter, errs
+
+    def _init_stats(self, params):
+        if params.get('explain') and not params.get('_stats'):
+            params['_stats'] = QueryStats()
+
+        return params.get('_stats')
 
     def __call__(self, params):
         mode = params.get('mode', 'index')
@@ -99,6 +122,8 @@ class IndexHandler(object):
         if mode != 'index':
             return {}, self.get_supported_modes(), {}
 
+        stats = self._init_stats(params)
+
         output = params.get('output', self.DEF_OUTPUT)
         fields = params.get('fields')
 
@@ -120,6 +145,15 @@ class IndexHandler(object):
                     line = line.encode('utf-8')
                 yield line
 
+        if stats:
+            # run the full query, returning only the stats
+            for line in stats.timed_iter(check_str(res), 'output'):
+                pass
+
+            stats.finish()
+            out_headers = {'Server-Timing': stats.to_server_timing()}
+            return out_headers, {'explain': stats.to_dict()}, errs
+
         return out_headers, check_str(res), errs
 
 
@@ -138,6 +172,8 @@ class ResourceHandler(IndexHandler):
         if params.get('mode', 'resource') != 'resource':
             return super(ResourceHandler, self).__call__(params)
 
+        stats = self._init_stats(params)
+
         cdx_iter, errs = self._load_index_source(params)
         if not cdx_iter:
             return None, None, errs
@@ -146,14 +182,25 @@ class ResourceHandler(IndexHandler):
 
         for cdx in cdx_iter:
             for loader in self.resource_loaders:
+                if stats:
+                    start = time.time()
+
                 try:
                     out_headers, resp = loader(cdx, params)
                     if resp is not None:
+                        if stats:
+                            stats.add_loader(str(loader), time.time() - start)
+                            stats.finish()
+                            out_headers['Server-Timing'] = stats.to_server_timing()
+
                         return out_headers, resp, errs
                 except WbException as e:
                     last_exc = e
                     errs[str(loader)] = str(e)
 
+                if stats:
+                    stats.add_loader(str(loader), time.time() - start)
+
         if last_exc:
             errs['last_exc'] = last_exc
 
@@ -162,8 +209,14 @@ class ResourceHandler(IndexHandler):
 
 #=============================================================================
 class DefaultResourceHandler(ResourceHandler):
-    def __init__(self, index_source, warc_paths=''):
-        loaders = [WARCPathLoader(warc_paths, index_source),
+    def __init__(self, index_source, warc_paths='', remote_store=None,
+                 record_cache=None, digest_index=None, seek_indexes=None):
+        warc_loader = WARCPathLoader(warc_paths, index_source, remote_store,
+                                     digest_index, seek_indexes)
+        if record_cache:
+            warc_loader = CachingLoader(warc_loader, record_cache)
+
+        loaders = [warc_loader,
                    LiveWebLoader(),
                    VideoLoader()
                   ]
@@ -0,0 +1,261 @@
+from requests.structures import CaseInsensitiveDict
+
+from email.utils import parsedate_tz, mktime_tz
+from collections import OrderedDict
+
+import hashlib
+import json
+import os
+import re
+import tempfile
+import time
+
+
+CACHE_CONTROL_RX = re.compile(r'([\w-]+)(?:\s*=\s*"?([^",]*)"?)?')
+
+
+#=============================================================================
+def parse_http_date(value):
+    if not value:
+        return None
+
+    parsed = parsedate_tz(value)
+    if not parsed:
+        return None
+
+    try:
+        return mktime_tz(parsed)
+    except (OverflowError, ValueError):
+        return None
+
+
+#=============================================================================
+def parse_cache_control(value):
+    directives = {}
+    if not value:
+        return directives
+
+    for name, arg in CACHE_CONTROL_RX.findall(value):
+        directives[name.lower()] = arg
+
+    return directives
+
+
+#=============================================================================
+class CachedResponse(object):
+    """ Minimal response from the cache, or a fully read
+    requests response, with the same attributes the index sources use
+    """
+    def __init__(self, status_code, headers, content, from_cache=False):
+        self.status_code = status_code
+        self.headers = CaseInsensitiveDict(headers)
+        self.content = content
+        self.from_cache = from_cache
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', 'replace')
+
+    def to_entry(self, expires):
+        return {'status': self.status_code,
+                'headers': dict(self.headers),
+                'expires': expires}
+
+    @staticmethod
+    def from_entry(entry, content):
+        return CachedResponse(entry['status'], entry['headers'], content,
+                              from_cache=True)
+
+
+#=============================================================================
+class HttpCache(object):
+    """ Two-tier (memory and optional disk) cache of remote responses,
+    following HTTP cache semantics for a shared cache:
+
+    - freshness from Cache-Control s-maxage/max-age, then Expires,
+      then a heuristic based on Last-Modified
+    - no-store and private responses are never stored
+    - stale entries with an ETag or Last-Modified are revalidated
+      with a conditional request
+
+    'min_ttl' passed to get_fresh_until() acts as a floor on freshness,
+    so slowly changing sources can be cached even without cache headers
+    """
+    CACHEABLE_STATUS = (200, 203, 300, 301, 404, 410)
+
+    HEURISTIC_FRACTION = 0.1
+    MAX_HEURISTIC_TTL = 86400
+
+    PRUNE_INTERVAL = 100
+
+    def __init__(self, max_mem_size=16 * 1024 * 1024, cache_dir=None,
+                 max_disk_entries=10000):
+        self.max_mem_size = max_mem_size
+        self.mem_size = 0
+        self.mem_cache = OrderedDict()
+
+        self.cache_dir = cache_dir
+        self.max_disk_entries = max_disk_entries
+        self.num_puts = 0
+
+        if cache_dir and not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+    def get_fresh_until(self, headers, min_ttl=0, now=None):
+        """ Return time until which response is fresh, or None
+        if the response may not be stored
+        """
+        now = now or time.time()
+
+        cc = parse_cache_control(headers.get('Cache-Control'))
+        if 'no-store' in cc or 'private' in cc:
+            return None
+
+        ttl = None
+
+        if 'no-cache' in cc:
+            ttl = 0
+
+        for name in ('s-maxage', 'max-age'):
+            if ttl is None and cc.get(name):
+                try:
+                    ttl = int(cc[name])
+                except ValueError:
+                    pass
+
+        date = parse_http_date(headers.get('Date')) or now
+
+        if ttl is None and headers.get('Expires'):
+            # invalid Expires means already expired
+            expires = parse_http_date(headers.get('Expires'))
+            ttl = (expires - date) if expires else 0
+
+        if ttl is None:
+            last_mod = parse_http_date(headers.get('Last-Modified'))
+            if last_mod and last_mod < date:
+                ttl = min((date - last_mod) * self.HEURISTIC_FRACTION,
+                          self.MAX_HEURISTIC_TTL)
+            else:
+                ttl = 0
+
+        try:
+            ttl -= int(headers.get('Age', 0))
+        except ValueError:
+            pass
+
+        return now + max(ttl, min_ttl, 0)
+
+    @staticmethod
+    def make_key(url):
+        return hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+    def get(self, url):
+        """ Return (entry, content) for url, or (None, None)
+        """
+        key = self.make_key(url)
+
+        res = self.mem_cache.pop(key, None)
+        if res:
+            self.mem_cache[key] = res
+            return res
+
+        res = self._load_disk(key)
+        if res:
+            self._put_mem(key, res)
+            return res
+
+        return None, None
+
+    def put(self, url, entry, content):
+        key = self.make_key(url)
+        self._put_mem(key, (entry, content))
+        self._save_disk(key, entry, content)
+
+    def remove(self, url):
+        key = self.make_key(url)
+        res = self.mem_cache.pop(key, None)
+        if res:
+            self.mem_size -= len(res[1])
+
+        if self.cache_dir:
+            try:
+                os.remove(os.path.join(self.cache_dir, key))
+            except OSError:
+                pass
+
+    def _put_mem(self, key, res):
+        size = len(res[1])
+        if size > self.max_mem_size:
+            return
+
+        old = self.mem_cache.pop(key, None)
+        if old:
+            self.mem_size -= len(old[1])
+
+        while self.mem_cache and self.mem_size + size > self.max_mem_size:
+            _, (_, old_content) = self.mem_cache.popitem(last=False)
+            self.mem_size -= len(old_content)
+
+        self.mem_cache[key] = res
+        self.mem_size += size
+
+    def _load_disk(self, key):
+        if not self.cache_dir:
+            return None
+
+        try:
+            with open(os.path.join(self.cache_dir, key), 'rb') as fh:
+                entry = json.loads(fh.readline().decode('utf-8'))
+                content = fh.read()
+        except (IOError, OSError, ValueError):
+            return None
+
+        return entry, content
+
+    def _save_disk(self, key, entry, content):
+        if not self.cache_dir:
+            return
+
+        fd, temp_name = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as fh:
+                fh.write(json.dumps(entry).encode('utf-8') + b'\n')
+                fh.write(content)
+
+            os.rename(temp_name, os.path.join(self.cache_dir, key))
+        except (IOError, OSError):
+            try:
+                os.remove(temp_name)
+            except OSError:
+                pass
+            return
+
+        self.num_puts += 1
+        if self.num_puts % self.PRUNE_INTERVAL == 0:
+            self.prune_disk()
+
+    def prune_disk(self):
+        """ Remove least recently written entries over max_disk_entries
+        """
+        try:
+            names = [name for name in os.listdir(self.cache_dir)
+                     if not name.endswith('.tmp')]
+        except OSError:
+            return
+
+        if len(names) <= self.max_disk_entries:
+            return
+
+        def mtime(name):
+            try:
+                return os.path.getmtime(os.path.join(self.cache_dir, name))
+            except OSError:
+                return 0
+
+        names.sort(key=mtime)
+
+        for name in names[:len(names) - self.max_disk_entries]:
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except OSError:
+                pass
@@ -0,0 +1,210 @@
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from six.moves.http_cookiejar import DefaultCookiePolicy
+
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from collections import OrderedDict
+
+from webagg.httpcache import CachedResponse
+
+import requests
+import socket
+import time
+
+
+#=============================================================================
+class DNSCache(object):
+    """ Bounded cache of resolved host addresses, with a fixed ttl
+    """
+    def __init__(self, ttl=300, max_size=1000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.cache = OrderedDict()
+
+    def resolve(self, host, port):
+        now = time.time()
+
+        entry = self.cache.get(host)
+        if entry and entry[0] > now:
+            return entry[1]
+
+        try:
+            addr = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)[0][4][0]
+        except socket.gaierror:
+            # let the connection attempt report the error
+            return host
+
+        self.cache.pop(host, None)
+        while len(self.cache) >= self.max_size:
+            self.cache.popitem(last=False)
+
+        self.cache[host] = (now + self.ttl, addr)
+        return addr
+
+    def clear(self):
+        self.cache.clear()
+
+
+DNS_CACHE = DNSCache()
+
+
+#=============================================================================
+class DNSCacheConnMixin(object):
+    dns_cache = DNS_CACHE
+
+    def _new_conn(self):
+        # only the socket connects to the cached address,
+        # host is still used for the Host header and TLS SNI
+        orig_host = self._dns_host
+        self._dns_host = self.dns_cache.resolve(orig_host, self.port)
+        try:
+            return super(DNSCacheConnMixin, self)._new_conn()
+        finally:
+            self._dns_host = orig_host
+
+
+class DNSCacheHTTPConnection(DNSCacheConnMixin, HTTPConnection):
+    pass
+
+
+class DNSCacheHTTPSConnection(DNSCacheConnMixin, HTTPSConnection):
+    pass
+
+
+class DNSCacheHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = DNSCacheHTTPConnection
+
+
+class DNSCacheHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = DNSCacheHTTPSConnection
+
+
+#=============================================================================
+class DNSCacheHTTPAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super(DNSCacheHTTPAdapter, self).init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': DNSCacheHTTPConnectionPool,
+            'https': DNSCacheHTTPSConnectionPool,
+        }
+
+
+#=============================================================================
+class RemoteHttpClient(object):
+    """ Keep-alive HTTP client shared by remote index sources
+
+    Connections are pooled per host, up to 'max_hosts' hosts and
+    'max_per_host' connections for each. If 'block' is set, requests
+    wait for a free connection instead of opening extra ones.
+    """
+    DEF_TIMEOUT = (5.0, 20.0)
+
+    # not meaningful for the decoded content stored in the cache
+    SKIP_CACHE_HEADERS = ('content-encoding', 'content-length',
+                          'transfer-encoding', 'connection')
+
+    REVALIDATE_HEADERS = ('cache-control', 'expires', 'date', 'age',
+                          'etag', 'last-modified')
+
+    def __init__(self, max_hosts=50, max_per_host=10, block=False,
+                 timeout=DEF_TIMEOUT, retries=1):
+        self.timeout = timeout
+
+        self.session = requests.Session()
+
+        # don't share cookies between unrelated index queries
+        self.session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+
+        adapter = DNSCacheHTTPAdapter(pool_connections=max_hosts,
+                                      pool_maxsize=max_per_host,
+                                      pool_block=block,
+                                      max_retries=retries)
+
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def get(self, url, timeout=None, **kwargs):
+        return self.session.get(url, timeout=timeout or self.timeout, **kwargs)
+
+    def head(self, url, timeout=None, **kwargs):
+        return self.session.head(url, timeout=timeout or self.timeout, **kwargs)
+
+    def get_cached(self, url, cache, min_ttl=0, timeout=None):
+        """ GET url through an HttpCache, revalidating stale entries,
+        and returning a fully read CachedResponse
+
+        A stale entry is also returned if the remote fails with a
+        connection error or a 5xx status
+        """
+        now = time.time()
+
+        entry, content = cache.get(url)
+        req_headers = {}
+
+        if entry:
+            if entry['expires'] > now:
+                return CachedResponse.from_entry(entry, content)
+
+            entry_headers = CaseInsensitiveDict(entry['headers'])
+            if entry_headers.get('ETag'):
+                req_headers['If-None-Match'] = entry_headers['ETag']
+
+            if entry_headers.get('Last-Modified'):
+                req_headers['If-Modified-Since'] = entry_headers['Last-Modified']
+
+        try:
+            r = self.get(url, timeout=timeout, headers=req_headers)
+        except requests.RequestException:
+            if entry:
+                return CachedResponse.from_entry(entry, content)
+            raise
+
+        if entry and (r.status_code == 304 or r.status_code >= 500):
+            if r.status_code == 304:
+                for name in self.REVALIDATE_HEADERS:
+                    if name in r.headers:
+                        entry_headers[name] = r.headers[name]
+
+                res = CachedResponse(entry['status'], entry_headers, content,
+                                     from_cache=True)
+
+                expires = cache.get_fresh_until(entry_headers, min_ttl)
+                if expires is not None:
+                    cache.put(url, res.to_entry(expires), content)
+                else:
+                    cache.remove(url)
+
+                return res
+
+            return CachedResponse.from_entry(entry, content)
+
+        headers = [(n, v) for n, v in r.headers.items()
+                   if n.lower() not in self.SKIP_CACHE_HEADERS]
+
+        res = CachedResponse(r.status_code, headers, r.content)
+
+        expires = None
+        if r.status_code in cache.CACHEABLE_STATUS:
+            expires = cache.get_fresh_until(res.headers, min_ttl)
+
+        if expires is not None and (expires > now or
+                                    'ETag' in res.headers or
+                                    'Last-Modified' in res.headers):
+            cache.put(url, res.to_entry(expires), res.content)
+        elif entry:
+            cache.remove(url)
+
+        return res
+
+
+#=============================================================================
+_default_client = None
+
+def get_default_client():
+    global _default_client
+    if not _default_client:
+        _default_client = RemoteHttpClient()
+
+    return _default_client
@@ -1,33 +1,150 @@
 import redis
+import itertools
+import time
 
-from pywb.utils.binsearch import iter_range
-from pywb.utils.timeutils import timestamp_to_http_date, http_date_to_timestamp
+from collections import deque, OrderedDict
+from contextlib import closing
+
+from pywb.utils.binsearch import iter_range, binsearch_offset
 from pywb.utils.timeutils import timestamp_now
 from pywb.utils.canonicalize import canonicalize
 from pywb.utils.wbexception import NotFoundException
 
 from pywb.cdx.cdxobject import CDXObject
 
-#from webagg.liverec import patched_requests as requests
-import requests
-
 from webagg.utils import ParamFormatter, res_template
-from webagg.utils import MementoUtils
+from webagg.dateutils import timestamp_to_http_date, http_date_to_timestamp
+from webagg.utils import MementoUtils, MementoException, BUFF_SIZE
+from webagg.httpclient import get_default_client
 
 
 WAYBACK_ORIG_SUFFIX = '{timestamp}id_/{url}'
 
 
+#=============================================================================
+def update_cache_stats(params, res):
+    src_stats = params.get('_src_stats')
+    if not src_stats:
+        return
+
+    if res.from_cache:
+        src_stats['cache_hits'] += 1
+    else:
+        src_stats['cache_misses'] += 1
+        src_stats['bytes_read'] += len(res.content)
+
+
 #=============================================================================
 class BaseIndexSource(object):
     def load_index(self, params):  #pragma: no cover
         raise NotImplemented()
 
 
+#=============================================================================
+def iter_lines_reverse(reader, end_offset, block_size=8192):
+    """
+    Iterate over lines ending before 'end_offset' in reverse order,
+    reading 'block_size' blocks backwards from 'end_offset',
+    which must be the start of a line
+    """
+    pos = end_offset
+    tail = b''
+
+    while pos > 0:
+        read_size = min(block_size, pos)
+        pos -= read_size
+        reader.seek(pos)
+        lines = (reader.read(read_size) + tail).split(b'\n')
+        tail = lines[0]
+        for line in reversed(lines[1:]):
+            if line:
+                yield line.rstrip()
+
+    if tail:
+        yield tail.rstrip()
+
+
+#=============================================================================
+def iter_closest_range(reader, start, end, closest_key, window,
+                       block_size=8192):
+    """
+    Creates an iterator over lines where start <= line < end,
+    skipping all but up to 'window' lines before 'closest_key'
+
+    Binary search seeks directly to 'closest_key', and any earlier lines
+    within the window are read backwards from there, so the cost is
+    O(log n + window) instead of reading the full range
+    """
+    offset = binsearch_offset(reader, closest_key, block_size=block_size)
+    reader.seek(offset)
+    if offset > 0:
+        reader.readline()  # skip partial line
+
+    line_start = reader.tell()
+
+    prev_lines = deque(maxlen=window)
+
+    line = reader.readline().rstrip()
+    while line and line < closest_key:
+        if line >= start:
+            prev_lines.append(line)
+        line = reader.readline().rstrip()
+
+    # not enough lines in first block, continue backwards up to window
+    if len(prev_lines) < window and line_start > 0:
+        needed = window - len(prev_lines)
+        reader_pos = reader.tell()
+
+        back_lines = []
+        for back_line in iter_lines_reverse(reader, line_start, block_size):
+            if back_line < start or len(back_lines) == needed:
+                break
+            back_lines.append(back_line)
+
+        prev_lines.extendleft(back_lines)
+        reader.seek(reader_pos)
+
+    def next_lines(line):
+        while line:
+            yield line
+            line = reader.readline().rstrip()
+
+    return itertools.chain(prev_lines,
+                           itertools.takewhile(lambda line: line < end,
+                                               next_lines(line)))
+
+
 #=============================================================================
 class FileIndexSource(BaseIndexSource):
-    def __init__(self, filename):
+    DEF_CLOSEST_WINDOW = 100
+
+    # closest lookup must read full range if any of these are set
+    FULL_RANGE_PARAMS = ('filter', 'collapseTime', 'resolveRevisits',
+                         'from', 'from_ts', 'to')
+
+    def __init__(self, filename, closest_window=DEF_CLOSEST_WINDOW):
         self.filename_template = filename
+        self.closest_window = closest_window
+
+    def get_closest_window(self, params):
+        """ Return number of captures before 'closest' that need to be
+        loaded for an exact closest query, or 0 if full range is needed
+        """
+        if not self.closest_window or not params.get('closest'):
+            return 0
+
+        if params.get('matchType', 'exact') != 'exact':
+            return 0
+
+        if any(params.get(name) for name in self.FULL_RANGE_PARAMS):
+            return 0
+
+        try:
+            limit = int(params.get('limit', 0))
+        except ValueError:
+            limit = 0
+
+        return max(limit, self.closest_window)
 
     def load_index(self, params):
         filename = res_template(self.filename_template, params)
@@ -37,10 +154,26 @@ class FileIndexSource(BaseIndexSource):
         except IOError:
             raise NotFoundException(filename)
 
+        window = self.get_closest_window(params)
+        src_stats = params.get('_src_stats')
+
         def do_load(fh):
             with fh:
-                gen = iter_range(fh, params['key'], params['end_key'])
+                if window:
+                    closest_key = (params['key'] + b' ' +
+                                   params['closest'].encode('utf-8'))
+
+                    gen = iter_closest_range(fh,
+                                             params['key'],
+                                             params['end_key'],
+                                             closest_key,
+                                             window)
+                else:
+                    gen = iter_range(fh, params['key'], params['end_key'])
+
                 for line in gen:
+                    if src_stats:
+                        src_stats['bytes_read'] += len(line) + 1
                     yield CDXObject(line)
 
         return do_load(fh)
@@ -51,25 +184,63 @@ class FileIndexSource(BaseIndexSource):
 
 #=============================================================================
 class RemoteIndexSource(BaseIndexSource):
-    def __init__(self, api_url, replay_url, url_field='load_url'):
+    def __init__(self, api_url, replay_url, url_field='load_url', client=None,
+                 cache=None, min_ttl=0):
         self.api_url_template = api_url
         self.replay_url = replay_url
         self.url_field = url_field
+        self.client = client or get_default_client()
+        self.cache = cache
+        self.min_ttl = min_ttl
 
     def load_index(self, params):
         api_url = res_template(self.api_url_template, params)
-        r = requests.get(api_url, timeout=params.get('_timeout'))
+
+        if self.cache:
+            return self.load_cached_index(api_url, params)
+
+        r = self.client.get(api_url, timeout=params.get('_timeout'), stream=True)
+        if r.status_code >= 400:
+            r.close()
+            raise NotFoundException(api_url)
+
+        src_stats = params.get('_src_stats')
+
+        def do_load(r):
+            with closing(r):
+                for line in r.iter_lines(chunk_size=BUFF_SIZE):
+                    if not line:
+                        continue
+
+                    if src_stats:
+                        src_stats['bytes_read'] += len(line) + 1
+
+                    cdx = CDXObject(line)
+                    self._set_load_url(cdx)
+                    yield cdx
+
+        return do_load(r)
+
+    def load_cached_index(self, api_url, params):
+        # cached responses must be read in full, so no streaming here
+        r = self.client.get_cached(api_url, self.cache, self.min_ttl,
+                                   timeout=params.get('_timeout'))
+
+        update_cache_stats(params, r)
+
         if r.status_code >= 400:
             raise NotFoundException(api_url)
 
-        lines = r.content.strip().split(b'\n')
         def do_load(lines):
             for line in lines:
+                if not line:
+                    continue
+
                 cdx = CDXObject(line)
                 self._set_load_url(cdx)
                 yield cdx
 
-        return do_load(lines)
+        return do_load(r.content.split(b'\n'))
 
     def _set_load_url(self, cdx):
         cdx[self.url_field] = self.replay_url.format(
@@ -132,6 +303,10 @@ class RedisIndexSource(BaseIndexSource):
                                             b'[' + params['key'],
                                             b'(' + params['end_key'])
 
+        src_stats = params.get('_src_stats')
+        if src_stats:
+            src_stats['bytes_read'] += sum(len(line) for line in index_list)
+
         def do_load(index_list):
             for line in index_list:
                 yield CDXObject(line)
@@ -143,82 +318,217 @@ class RedisIndexSource(BaseIndexSource):
 
 
 #=============================================================================
-class MementoIndexSource(BaseIndexSource):
-    def __init__(self, timegate_url, timemap_url, replay_url):
-        self.timegate_url = timegate_url
-        self.timemap_url = timemap_url
-        self.replay_url = replay_url
+class TimemapCache(object):
+    """ Bounded LRU cache of parsed timemaps, expiring after 'ttl' secs
+    """
+    def __init__(self, max_size=1000, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.cache = OrderedDict()
 
-    def links_to_cdxobject(self, link_header, def_name):
-        results = MementoUtils.parse_links(link_header, def_name)
+    def get(self, url):
+        entry = self.cache.pop(url, None)
+        if not entry:
+            return None
 
-        #meta = MementoUtils.meta_field('timegate', results)
-        #if meta:
-        #    yield meta
+        expires, value = entry
+        if expires <= time.time():
+            return None
 
-        #meta = MementoUtils.meta_field('timemap', results)
-        #if meta:
-        #    yield meta
+        self.cache[url] = entry
+        return value
 
-        #meta = MementoUtils.meta_field('original', results)
-        #if meta:
-        #    yield meta
+    def put(self, url, value):
+        self.cache.pop(url, None)
+        while len(self.cache) >= self.max_size:
+            self.cache.popitem(last=False)
 
-        original = results['original']['url']
-        key = canonicalize(original)
+        self.cache[url] = (time.time() + self.ttl, value)
 
-        mementos = results['mementos']
 
-        for val in mementos:
-            dt = val['datetime']
-            ts = http_date_to_timestamp(dt)
+#=============================================================================
+class MementoIndexSource(BaseIndexSource):
+    def __init__(self, timegate_url, timemap_url, replay_url, client=None,
+                 cache=None, min_ttl=0, timemap_cache=None,
+                 prefetch_timemap=False):
+        self.timegate_url = timegate_url
+        self.timemap_url = timemap_url
+        self.replay_url = replay_url
+        self.client = client or get_default_client()
+        self.cache = cache
+        self.min_ttl = min_ttl
+
+        # if set, closest queries are answered from recently loaded timemaps
+        self.timemap_cache = timemap_cache
+
+        # if set, closest queries load the timemap instead of the timegate
+        self.prefetch_timemap = prefetch_timemap and timemap_cache is not None
+
+    def iter_mementos(self, links, def_name):
+        """ Parse links incrementally, returning original url, key and an
+        iterator of (timestamp, rel, memento url) as they are parsed
+
+        Links are parsed up to the 'original' link right away, so that
+        a missing original is reported as a load error
+        """
+        link_iter = MementoUtils.iter_links(links, def_name)
+
+        def to_memento(link):
+            return (http_date_to_timestamp(link['datetime']),
+                    link.get('rel', ''),
+                    link['url'])
+
+        pending = []
+        original = None
+
+        for name, link in link_iter:
+            if name == 'original':
+                original = link['url']
+                break
+            elif name == 'memento':
+                pending.append(to_memento(link))
+
+        if not original:
+            raise NotFoundException('No original in memento links')
+
+        def remaining():
+            try:
+                for name, link in link_iter:
+                    if name == 'memento':
+                        yield to_memento(link)
+            except MementoException:
+                # keep mementos parsed before a malformed tail
+                pass
+
+        return (original, canonicalize(original),
+                itertools.chain(pending, remaining()))
+
+    def parse_mementos(self, links, def_name):
+        original, key, mementos = self.iter_mementos(links, def_name)
+        return original, key, list(mementos)
+
+    def mementos_to_cdxobject(self, original, key, mementos):
+        for ts, rel, memento_url in mementos:
             cdx = CDXObject()
             cdx['urlkey'] = key
             cdx['timestamp'] = ts
             cdx['url'] = original
-            cdx['mem_rel'] = val.get('rel', '')
-            cdx['memento_url'] = val['url']
+            cdx['mem_rel'] = rel
+            cdx['memento_url'] = memento_url
 
-            load_url = self.replay_url.format(timestamp=cdx['timestamp'],
+            load_url = self.replay_url.format(timestamp=ts,
                                               url=original)
 
             cdx['load_url'] = load_url
             yield cdx
 
+    def links_to_cdxobject(self, links, def_name):
+        return self.mementos_to_cdxobject(*self.iter_mementos(links,
+                                                              def_name))
+
     def get_timegate_links(self, params, closest):
         url = res_template(self.timegate_url, params)
         accept_dt = timestamp_to_http_date(closest)
-        res = requests.head(url, headers={'Accept-Datetime': accept_dt})
+        res = self.client.head(url, headers={'Accept-Datetime': accept_dt},
+                               timeout=params.get('_timeout'))
         if res.status_code >= 400:
             raise NotFoundException(url)
 
-        return res.headers.get('Link')
+        links = res.headers.get('Link')
+        if not links:
+            raise NotFoundException(url)
+
+        src_stats = params.get('_src_stats')
+        if src_stats and links:
+            src_stats['bytes_read'] += len(links)
+
+        return links
 
     def get_timemap_links(self, params):
+        """ Return the timemap as bytes if cached, otherwise
+        as an iterator of chunks streamed from the response
+        """
         url = res_template(self.timemap_url, params)
-        res = requests.get(url, timeout=params.get('_timeout'))
+        if self.cache:
+            res = self.client.get_cached(url, self.cache, self.min_ttl,
+                                         timeout=params.get('_timeout'))
+            update_cache_stats(params, res)
+
+            if res.status_code >= 400:
+                raise NotFoundException(url)
+
+            return res.content
+
+        res = self.client.get(url, timeout=params.get('_timeout'),
+                              stream=True)
+
         if res.status_code >= 400:
+            res.close()
             raise NotFoundException(url)
 
-        return res.text
+        return self.iter_timemap_content(res, params.get('_src_stats'))
+
+    def iter_timemap_content(self, res, src_stats):
+        with closing(res):
+            for chunk in res.iter_content(BUFF_SIZE):
+                if src_stats:
+                    src_stats['bytes_read'] += len(chunk)
+
+                yield chunk
+
+    def load_timemap(self, params):
+        """ Load timemap, storing parsed mementos, sorted by timestamp,
+        in the timemap cache
+        """
+        links = self.get_timemap_links(params)
+
+        original, key, mementos = self.parse_mementos(links, 'timemap')
+        mementos.sort(key=lambda mem: mem[0])
+
+        url = res_template(self.timemap_url, params)
+        self.timemap_cache.put(url, (original, key, mementos))
+
+        return self.mementos_to_cdxobject(original, key, mementos)
 
     def load_index(self, params):
         closest = params.get('closest')
 
+        if not self.timemap_cache:
+            if not closest:
+                links = self.get_timemap_links(params)
+                def_name = 'timemap'
+            else:
+                links = self.get_timegate_links(params, closest)
+                def_name = 'timegate'
+
+            return self.links_to_cdxobject(links, def_name)
+
         if not closest:
-            links = self.get_timemap_links(params)
-            def_name = 'timemap'
-        else:
-            links = self.get_timegate_links(params, closest)
-            def_name = 'timegate'
+            return self.load_timemap(params)
+
+        # closest memento computed from full timemap, if recently loaded
+        url = res_template(self.timemap_url, params)
+        timemap = self.timemap_cache.get(url)
+
+        src_stats = params.get('_src_stats')
+        if src_stats:
+            src_stats['cache_hits' if timemap else 'cache_misses'] += 1
+
+        if timemap:
+            return self.mementos_to_cdxobject(*timemap)
+
+        if self.prefetch_timemap:
+            return self.load_timemap(params)
 
-        return self.links_to_cdxobject(links, def_name)
+        links = self.get_timegate_links(params, closest)
+        return self.links_to_cdxobject(links, 'timegate')
 
     @staticmethod
-    def from_timegate_url(timegate_url, path='link'):
+    def from_timegate_url(timegate_url, path='link', **kwargs):
         return MementoIndexSource(timegate_url + '{url}',
                                   timegate_url + 'timemap/' + path + '/{url}',
-                                  timegate_url + WAYBACK_ORIG_SUFFIX)
+                                  timegate_url + WAYBACK_ORIG_SUFFIX,
+                                  **kwargs)
 
     def __str__(self):
         return 'memento'
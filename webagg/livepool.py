@@ -0,0 +1,173 @@
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.ssl_ import create_urllib3_context
+
+from collections import OrderedDict
+
+import urllib3
+import socket
+import threading
+import time
+
+
+#=============================================================================
+class DNSCache(object):
+    """ Cache of resolved addresses by (host, port), for 'ttl' seconds
+
+    Under gevent, each lookup otherwise goes through the resolver for
+    every new connection.
+    """
+    def __init__(self, ttl=300, max_size=10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def resolve(self, host, port):
+        key = (host, port)
+        now = time.time()
+
+        entry = self.cache.get(key)
+        if entry and entry[1] > now:
+            self.hits += 1
+            return entry[0]
+
+        self.misses += 1
+
+        addr = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)[0][4][0]
+
+        self.cache.pop(key, None)
+        while len(self.cache) >= self.max_size:
+            self.cache.popitem(last=False)
+
+        self.cache[key] = (addr, now + self.ttl)
+        return addr
+
+    def invalidate(self, host, port):
+        self.cache.pop((host, port), None)
+
+
+#=============================================================================
+class CachedDNSMixin(object):
+    """ Connects to the address from the pool manager's DNSCache, if any.
+    The host name is still used for the Host header, SNI and certificate
+    checks
+    """
+    def __init__(self, *args, **kwargs):
+        self.live_pool = kwargs.pop('live_pool', None)
+        super(CachedDNSMixin, self).__init__(*args, **kwargs)
+
+    def _new_conn(self):
+        live_pool = self.live_pool
+        if not live_pool:
+            return super(CachedDNSMixin, self)._new_conn()
+
+        live_pool.stats['connections'] += 1
+
+        dns_cache = live_pool.dns_cache
+        if not dns_cache:
+            return super(CachedDNSMixin, self)._new_conn()
+
+        host = self._dns_host
+        try:
+            self._dns_host = dns_cache.resolve(host, self.port)
+        except socket.gaierror:
+            # report resolution error as usual
+            return super(CachedDNSMixin, self)._new_conn()
+
+        try:
+            return super(CachedDNSMixin, self)._new_conn()
+        except Exception:
+            dns_cache.invalidate(host, self.port)
+            raise
+        finally:
+            self._dns_host = host
+
+
+#=============================================================================
+class CachedDNSHTTPConnection(CachedDNSMixin, HTTPConnection):
+    pass
+
+
+class CachedDNSHTTPSConnection(CachedDNSMixin, HTTPSConnection):
+    pass
+
+
+class LiveHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = CachedDNSHTTPConnection
+
+
+class LiveHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = CachedDNSHTTPSConnection
+
+
+#=============================================================================
+class LivePoolManager(urllib3.PoolManager):
+    """ PoolManager for live web fetches
+
+    - the number of host pools kept grows, from 'num_pools' up to
+      'max_pools', as pools for more hosts are needed
+    - connections per host pool are limited by 'maxsize', or for
+      specific hosts by 'host_maxsize'
+    - new connections use a shared DNSCache, if 'dns_cache_ttl' is set
+    - https pools share one SSLContext, which is otherwise created and
+      loaded with the default CA certs for each new connection
+    - 'stats' counts requests and new connections, see get_stats()
+    """
+    def __init__(self, num_pools=10, max_pools=1000, maxsize=10,
+                 host_maxsize=None, dns_cache_ttl=300, ssl_context=None,
+                 **kwargs):
+
+        if ssl_context is None:
+            ssl_context = create_urllib3_context()
+            ssl_context.load_default_certs()
+
+        super(LivePoolManager, self).__init__(num_pools=num_pools,
+                                              maxsize=maxsize,
+                                              ssl_context=ssl_context,
+                                              **kwargs)
+
+        self.pool_classes_by_scheme = {'http': LiveHTTPConnectionPool,
+                                       'https': LiveHTTPSConnectionPool}
+
+        self.max_pools = max_pools
+        self.host_maxsize = host_maxsize or {}
+        self.dns_cache = DNSCache(dns_cache_ttl) if dns_cache_ttl else None
+
+        self.stats = {'requests': 0, 'connections': 0, 'pools': 0}
+        self.lock = threading.Lock()
+
+    def _new_pool(self, scheme, host, port, request_context=None):
+        with self.lock:
+            self.stats['pools'] += 1
+
+            # grow, instead of evicting a pool still in use
+            if len(self.pools) >= self.pools._maxsize:
+                self.pools._maxsize = min(self.pools._maxsize * 2, self.max_pools)
+
+        if request_context is None:
+            request_context = self.connection_pool_kw.copy()
+
+        if host in self.host_maxsize:
+            request_context['maxsize'] = self.host_maxsize[host]
+
+        pool = super(LivePoolManager, self)._new_pool(scheme, host, port,
+                                                      request_context)
+        pool.conn_kw['live_pool'] = self
+        return pool
+
+    def urlopen(self, method, url, *args, **kwargs):
+        self.stats['requests'] += 1
+        return super(LivePoolManager, self).urlopen(method, url, *args, **kwargs)
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        stats['reused'] = max(stats['requests'] - stats['connections'], 0)
+        stats['open_pools'] = len(self.pools)
+
+        if self.dns_cache:
+            stats['dns_hits'] = self.dns_cache.hits
+            stats['dns_misses'] = self.dns_cache.misses
+
+        return stats
@@ -8,10 +8,11 @@ from pywb.utils.timeutils import timestamp_now
 
 #=============================================================================
 class UpstreamAggIndexSource(RemoteIndexSource):
-    def __init__(self, base_url):
+    def __init__(self, base_url, client=None):
         api_url = base_url + '/index?url={url}'
         proxy_url = base_url + '/resource?url={url}&closest={timestamp}'
-        super(UpstreamAggIndexSource, self).__init__(api_url, proxy_url, 'filename')
+        super(UpstreamAggIndexSource, self).__init__(api_url, proxy_url, 'filename',
+                                                     client=client)
 
     def _set_load_url(self, cdx):
         super(UpstreamAggIndexSource, self)._set_load_url(cdx)
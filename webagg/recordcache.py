@@ -0,0 +1,223 @@
+from collections import OrderedDict
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+
+#=============================================================================
+class RecordCache(object):
+    """ Two-tier (memory and optional disk) cache of loaded records,
+    stored as response headers and the full decompressed record
+
+    Both tiers are bounded by total size and evicted by LRU. Admission
+    is frequency-based: a record is only stored once it has been
+    requested 'min_hits' times, and, if space must be made, only if it
+    has been requested at least as often as the records it would evict.
+    Request counts are halved periodically, so old popularity fades.
+    """
+    def __init__(self, max_mem_size=64 * 1024 * 1024,
+                 max_item_size=1024 * 1024,
+                 cache_dir=None,
+                 max_disk_size=1024 * 1024 * 1024,
+                 min_hits=2,
+                 sample_size=100000):
+
+        self.max_mem_size = max_mem_size
+        self.max_item_size = max_item_size
+        self.mem_size = 0
+        self.mem_cache = OrderedDict()
+
+        self.cache_dir = cache_dir
+        self.max_disk_size = max_disk_size
+        self.disk_size = 0
+        self.disk_entries = OrderedDict()
+
+        self.min_hits = min_hits
+        self.sample_size = sample_size
+        self.num_requests = 0
+        self.freq = {}
+
+        self.lock = threading.RLock()
+
+        if cache_dir:
+            self._init_disk()
+
+    def _init_disk(self):
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.tmp'):
+                continue
+
+            try:
+                st = os.stat(os.path.join(self.cache_dir, name))
+            except OSError:
+                continue
+
+            entries.append((st.st_mtime, name, st.st_size))
+
+        for _, name, size in sorted(entries):
+            self.disk_entries[name] = size
+            self.disk_size += size
+
+    @staticmethod
+    def make_key(filename, offset, length, source=''):
+        key = '{0} {1}:{2}:{3}'.format(source, filename, offset, length)
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def _record_request(self, key):
+        self.freq[key] = self.freq.get(key, 0) + 1
+        self.num_requests += 1
+
+        if self.num_requests >= self.sample_size:
+            self.num_requests = 0
+            self.freq = dict((k, v // 2) for k, v in self.freq.items() if v > 1)
+
+    def get(self, key):
+        """ Return (headers, record) or (None, None), counting the request
+        """
+        with self.lock:
+            self._record_request(key)
+
+            res = self.mem_cache.pop(key, None)
+            if res:
+                self.mem_cache[key] = res
+                return res
+
+            if key not in self.disk_entries:
+                return None, None
+
+            self.disk_entries[key] = self.disk_entries.pop(key)
+
+        res = self._load_disk(key)
+        if not res:
+            return None, None
+
+        with self.lock:
+            self._put_mem(key, res)
+
+        return res
+
+    def is_cacheable(self, size):
+        return size <= self.max_item_size
+
+    def put(self, key, headers, record):
+        """ Store record if admitted, return True if stored
+        """
+        if not self.is_cacheable(len(record)):
+            return False
+
+        with self.lock:
+            if self.freq.get(key, 0) < self.min_hits:
+                return False
+
+            if not self._put_mem(key, (headers, record)):
+                return False
+
+        if self.cache_dir:
+            self._save_disk(key, headers, record)
+
+        return True
+
+    def _admit(self, key, size, entries, total, max_size, get_size):
+        """ Return list of LRU keys to evict to fit 'size', or None if
+        any is requested more often than key
+        """
+        freq = self.freq.get(key, 0)
+        victims = []
+
+        for victim in entries:
+            if total + size <= max_size:
+                break
+
+            if self.freq.get(victim, 0) > freq:
+                return None
+
+            victims.append(victim)
+            total -= get_size(entries[victim])
+
+        if total + size > max_size:
+            return None
+
+        return victims
+
+    def _put_mem(self, key, res):
+        size = len(res[1])
+
+        old = self.mem_cache.pop(key, None)
+        if old:
+            self.mem_size -= len(old[1])
+
+        victims = self._admit(key, size, self.mem_cache, self.mem_size,
+                              self.max_mem_size, lambda entry: len(entry[1]))
+
+        if victims is None:
+            return False
+
+        for victim in victims:
+            self.mem_size -= len(self.mem_cache.pop(victim)[1])
+
+        self.mem_cache[key] = res
+        self.mem_size += size
+        return True
+
+    def _load_disk(self, key):
+        try:
+            with open(os.path.join(self.cache_dir, key), 'rb') as fh:
+                headers = json.loads(fh.readline().decode('utf-8'))
+                record = fh.read()
+        except (IOError, OSError, ValueError):
+            with self.lock:
+                size = self.disk_entries.pop(key, None)
+                if size:
+                    self.disk_size -= size
+            return None
+
+        return headers, record
+
+    def _save_disk(self, key, headers, record):
+        header_buff = json.dumps(headers).encode('utf-8') + b'\n'
+        size = len(header_buff) + len(record)
+
+        with self.lock:
+            old = self.disk_entries.pop(key, None)
+            if old:
+                self.disk_size -= old
+
+            victims = self._admit(key, size, self.disk_entries, self.disk_size,
+                                  self.max_disk_size, lambda size: size)
+
+            if victims is None:
+                return
+
+            for victim in victims:
+                self.disk_size -= self.disk_entries.pop(victim)
+                try:
+                    os.remove(os.path.join(self.cache_dir, victim))
+                except OSError:
+                    pass
+
+            self.disk_entries[key] = size
+            self.disk_size += size
+
+        fd, temp_name = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as fh:
+                fh.write(header_buff)
+                fh.write(record)
+
+            os.rename(temp_name, os.path.join(self.cache_dir, key))
+        except (IOError, OSError):
+            try:
+                os.remove(temp_name)
+            except OSError:
+                pass
+
+            with self.lock:
+                if self.disk_entries.pop(key, None):
+                    self.disk_size -= size
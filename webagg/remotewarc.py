@@ -0,0 +1,262 @@
+from webagg.httpclient import get_default_client
+
+from collections import OrderedDict
+
+import hashlib
+import os
+import tempfile
+import threading
+
+
+#=============================================================================
+class BlockCache(object):
+    """ Fixed-size cache of remote file blocks, by (url, block number),
+    in memory and, if 'cache_dir' is set, on disk
+
+    Both tiers are bounded by number of blocks and evicted by LRU.
+    """
+    def __init__(self, max_mem_blocks=256, cache_dir=None,
+                 max_disk_blocks=4096):
+        self.max_mem_blocks = max_mem_blocks
+        self.mem_cache = OrderedDict()
+
+        self.cache_dir = cache_dir
+        self.max_disk_blocks = max_disk_blocks
+        self.disk_keys = OrderedDict()
+
+        self.lock = threading.RLock()
+
+        if cache_dir:
+            if not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir)
+
+            # existing blocks, oldest first
+            names = [name for name in os.listdir(cache_dir)
+                     if not name.endswith('.tmp')]
+            names.sort(key=lambda name: os.path.getmtime(os.path.join(cache_dir, name)))
+            for name in names:
+                self.disk_keys[name] = True
+
+    @staticmethod
+    def make_key(url, block):
+        return hashlib.sha1(url.encode('utf-8')).hexdigest() + '-' + str(block)
+
+    def get(self, url, block):
+        key = self.make_key(url, block)
+
+        with self.lock:
+            buff = self.mem_cache.pop(key, None)
+            if buff is not None:
+                self.mem_cache[key] = buff
+                return buff
+
+            if key not in self.disk_keys:
+                return None
+
+            self.disk_keys.pop(key)
+            self.disk_keys[key] = True
+
+        try:
+            with open(os.path.join(self.cache_dir, key), 'rb') as fh:
+                buff = fh.read()
+        except (IOError, OSError):
+            with self.lock:
+                self.disk_keys.pop(key, None)
+            return None
+
+        self._put_mem(key, buff)
+        return buff
+
+    def put(self, url, block, buff):
+        key = self.make_key(url, block)
+        self._put_mem(key, buff)
+
+        if self.cache_dir:
+            self._save_disk(key, buff)
+
+    def _put_mem(self, key, buff):
+        with self.lock:
+            self.mem_cache.pop(key, None)
+            while len(self.mem_cache) >= self.max_mem_blocks:
+                self.mem_cache.popitem(last=False)
+
+            self.mem_cache[key] = buff
+
+    def _save_disk(self, key, buff):
+        fd, temp_name = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as fh:
+                fh.write(buff)
+
+            os.rename(temp_name, os.path.join(self.cache_dir, key))
+        except (IOError, OSError):
+            try:
+                os.remove(temp_name)
+            except OSError:
+                pass
+            return
+
+        with self.lock:
+            self.disk_keys.pop(key, None)
+            self.disk_keys[key] = True
+
+            while len(self.disk_keys) > self.max_disk_blocks:
+                old_key, _ = self.disk_keys.popitem(last=False)
+                try:
+                    os.remove(os.path.join(self.cache_dir, old_key))
+                except OSError:
+                    pass
+
+
+#=============================================================================
+class RemoteWARCStore(object):
+    """ Loads byte ranges of WARCs over HTTP, in fixed size blocks
+
+    Missing blocks are fetched with a single range request for each run
+    of adjacent blocks (up to 'max_fetch_blocks'), so a record spanning
+    several blocks, or adjacent records loaded together, cost one
+    request. Blocks are kept in a BlockCache, shared by all records.
+    """
+    def __init__(self, client=None, cache=None, block_size=65536,
+                 max_fetch_blocks=16):
+        self.client = client or get_default_client()
+        self.cache = cache or BlockCache()
+        self.block_size = block_size
+        self.max_fetch_blocks = max_fetch_blocks
+
+    def open(self, url, offset=0, length=-1):
+        return RemoteWARCReader(self, url, offset, length)
+
+    def read_range(self, url, start, end):
+        """ Read bytes [start, end) of url, or less if at end of file
+        """
+        first = start // self.block_size
+        last = (end - 1) // self.block_size
+
+        blocks = {}
+        missing = []
+
+        for block in range(first, last + 1):
+            buff = self.cache.get(url, block)
+            if buff is not None:
+                blocks[block] = buff
+            else:
+                missing.append(block)
+
+        # group missing blocks into runs of adjacent blocks
+        runs = []
+        for block in missing:
+            if (runs and runs[-1][1] == block - 1 and
+                runs[-1][1] - runs[-1][0] + 1 < self.max_fetch_blocks):
+                runs[-1][1] = block
+            else:
+                runs.append([block, block])
+
+        for run_first, run_last in runs:
+            blocks.update(self.fetch_blocks(url, run_first, run_last))
+
+        buff = b''
+        for block in range(first, last + 1):
+            data = blocks.get(block, b'')
+            buff += data
+            # end of file
+            if len(data) < self.block_size:
+                break
+
+        offset = start - first * self.block_size
+        return buff[offset:offset + end - start]
+
+    def fetch_blocks(self, url, first, last):
+        start = first * self.block_size
+        end = (last + 1) * self.block_size
+
+        headers = {'Range': 'bytes={0}-{1}'.format(start, end - 1)}
+        res = self.client.get(url, headers=headers)
+
+        if res.status_code == 206:
+            content = res.content
+        elif res.status_code == 200:
+            # range not supported, full response
+            content = res.content[start:end]
+        elif res.status_code == 416:
+            content = b''
+        else:
+            raise IOError('Remote WARC load failed: {0} {1}'.format(res.status_code, url))
+
+        blocks = {}
+        for block in range(first, last + 1):
+            pos = (block - first) * self.block_size
+            data = content[pos:pos + self.block_size]
+            blocks[block] = data
+            self.cache.put(url, block, data)
+
+            if len(data) < self.block_size:
+                break
+
+        return blocks
+
+
+#=============================================================================
+class RemoteWARCReader(object):
+    """ Reader for a range of a remote WARC, reading through the
+    RemoteWARCStore a window of blocks at a time
+    """
+    def __init__(self, store, url, offset, length=-1):
+        self.store = store
+        self.url = url
+        self.pos = offset
+        self.end = offset + length if length >= 0 else None
+
+        self.buff = b''
+        self.buff_pos = 0
+
+    def _fill(self):
+        window = self.store.block_size * self.store.max_fetch_blocks
+        end = self.pos + window
+        if self.end is not None:
+            end = min(end, self.end)
+
+        if end <= self.pos:
+            return False
+
+        self.buff = self.store.read_range(self.url, self.pos, end)
+        self.buff_pos = 0
+        return len(self.buff) > 0
+
+    def read(self, size=-1):
+        if self.buff_pos >= len(self.buff) and not self._fill():
+            return b''
+
+        if size is None or size < 0:
+            size = len(self.buff) - self.buff_pos
+
+        data = self.buff[self.buff_pos:self.buff_pos + size]
+        self.buff_pos += len(data)
+        self.pos += len(data)
+        return data
+
+    def readline(self, size=-1):
+        line = b''
+        while size is None or size < 0 or len(line) < size:
+            if self.buff_pos >= len(self.buff) and not self._fill():
+                break
+
+            end = self.buff.find(b'\n', self.buff_pos)
+            end = len(self.buff) if end < 0 else end + 1
+
+            if size is not None and size >= 0:
+                end = min(end, self.buff_pos + size - len(line))
+
+            data = self.buff[self.buff_pos:end]
+            self.buff_pos = end
+            self.pos += len(data)
+            line += data
+
+            if line.endswith(b'\n'):
+                break
+
+        return line
+
+    def close(self):
+        self.buff = b''
+        self.buff_pos = 0
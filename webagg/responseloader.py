@@ -1,27 +1,40 @@
-from webagg.utils import MementoUtils, StreamIter, chunk_encode_iter
+from webagg.utils import MementoUtils, StreamIter, FileRange, chunk_encode_iter
 from webagg.utils import ParamFormatter
 from webagg.indexsource import RedisIndexSource
+from webagg.filepool import PooledBlockLoader, WARC_FILE_POOL
+from webagg.recordcache import RecordCache
+from webagg.seekindex import SeekIndexCache
+from webagg.livepool import LivePoolManager
 
-from pywb.utils.timeutils import timestamp_to_datetime, datetime_to_timestamp
-from pywb.utils.timeutils import iso_date_to_datetime, datetime_to_iso_date
-from pywb.utils.timeutils import http_date_to_datetime, datetime_to_http_date
+from webagg.dateutils import timestamp_to_http_date, http_date_to_timestamp
+from webagg.dateutils import timestamp_to_iso_date, iso_date_to_http_date
 
 from pywb.utils.wbexception import LiveResourceException, WbException
 from pywb.utils.statusandheaders import StatusAndHeaders, StatusAndHeadersParser
 
 from pywb.warc.resolvingloader import ResolvingLoader
+from pywb.warc.recordloader import ArcWarcRecordLoader
+from pywb.utils.loaders import LimitReader
+from pywb.cdx.cdxobject import CDXObject
 
 from six.moves.urllib.parse import urlsplit, quote, unquote
+from six.moves.urllib.request import url2pathname
 
 from io import BytesIO
+from contextlib import closing
+from collections import OrderedDict
 
 import uuid
 import six
+import os
+import re
+import time
+import fnmatch
+import threading
 import itertools
 import json
 
 from requests.models import PreparedRequest
-import urllib3
 
 
 #=============================================================================
@@ -50,11 +63,16 @@ class BaseLoader(object):
                                 warc_headers.get_header('WARC-Target-URI'),
                                 'original')
 
-        memento_dt = iso_date_to_datetime(warc_headers.get_header('WARC-Date'))
-        out_headers['Memento-Datetime'] = datetime_to_http_date(memento_dt)
+        memento_dt = warc_headers.get_header('WARC-Date')
+        out_headers['Memento-Datetime'] = iso_date_to_http_date(memento_dt)
 
         warc_headers_buff = warc_headers.to_bytes()
 
+        if isinstance(stream, FileRange):
+            stream.header = warc_headers_buff + (other_headers or b'')
+            out_headers['Content-Length'] = str(len(stream.header) + stream.length)
+            return out_headers, stream
+
         lenset = self._set_content_len(warc_headers.get_header('Content-Length'),
                                      out_headers,
                                      len(warc_headers_buff))
@@ -131,44 +149,245 @@ class PrefixResolver(object):
 
 #=============================================================================
 class RedisResolver(RedisIndexSource):
+    """ Resolves WARC filenames to full paths, stored in redis hashes
+
+    If 'ttl' is set, resolved paths are cached for 'ttl' seconds. By
+    default, they are not, so that changes made directly to the hashes
+    apply at once.
+
+    The keys matching a wildcard key template are found once, and rescanned
+    in the background every 'keys_ttl' seconds. The hashes are then checked
+    in a single pipelined round trip.
+
+    Files added with WritableRedisIndexer.add_warc_file are published on
+    UPDATE_CHANNEL, and applied to cached paths and keys before each lookup.
+    """
+    UPDATE_CHANNEL = 'webagg:warc_files'
+
+    def __init__(self, redis_url, redis=None, key_template=None,
+                 ttl=0, keys_ttl=60, max_size=10000):
+        super(RedisResolver, self).__init__(redis_url, redis, key_template)
+        self.ttl = ttl
+        self.keys_ttl = keys_ttl
+        self.max_size = max_size
+
+        # (redis key, filename) -> (path, expires)
+        self.paths = OrderedDict()
+
+        # wildcard key -> [matching keys, expires]
+        self.key_sets = {}
+        self.refreshing = set()
+
+        self.pubsub = None
+        self.lock = threading.Lock()
+
     def __call__(self, filename, cdx):
         redis_key = self.redis_key_template
         if hasattr(cdx, '_formatter') and cdx._formatter:
             redis_key = cdx._formatter.format(redis_key)
 
+        is_wildcard = '*' in redis_key
+
+        if self.ttl or is_wildcard:
+            self.apply_updates()
+
+        now = time.time()
+        cache_key = (redis_key, filename)
+
+        if self.ttl:
+            cached = self.paths.get(cache_key)
+            if cached and cached[1] > now:
+                return cached[0]
+
+        if is_wildcard:
+            keys = self.get_keys(redis_key, now)
+        else:
+            keys = [redis_key]
+
         res = None
 
-        if '*' in redis_key:
-            for key in self.redis.scan_iter(redis_key):
-                #key = key.decode('utf-8')
-                res = self.redis.hget(key, filename)
+        if len(keys) == 1:
+            res = self.redis.hget(keys[0], filename)
+
+        elif keys:
+            pipe = self.redis.pipeline(transaction=False)
+            for key in keys:
+                pipe.hget(key, filename)
+
+            for res in pipe.execute():
                 if res:
                     break
-        else:
-            res = self.redis.hget(redis_key, filename)
 
-        if res and six.PY3:
+        if not res:
+            return None
+
+        if six.PY3:
             res = res.decode('utf-8')
 
+        if self.ttl:
+            self.paths.pop(cache_key, None)
+            while len(self.paths) >= self.max_size:
+                self.paths.popitem(last=False)
+
+            self.paths[cache_key] = (res, now + self.ttl)
+
         return res
 
+    def get_keys(self, pattern, now):
+        entry = self.key_sets.get(pattern)
+        if not entry:
+            entry = [self.scan_keys(pattern), now + self.keys_ttl]
+            self.key_sets[pattern] = entry
+
+        elif entry[1] <= now and pattern not in self.refreshing:
+            self.refreshing.add(pattern)
+            thread = threading.Thread(target=self.refresh_keys, args=(pattern,))
+            thread.daemon = True
+            thread.start()
+
+        return entry[0]
+
+    def scan_keys(self, pattern):
+        keys = self.redis.scan_iter(pattern)
+        if six.PY3:
+            keys = [key.decode('utf-8') for key in keys]
+
+        return sorted(keys)
+
+    def refresh_keys(self, pattern):
+        try:
+            self.key_sets[pattern] = [self.scan_keys(pattern),
+                                      time.time() + self.keys_ttl]
+        except Exception:
+            pass
+        finally:
+            self.refreshing.discard(pattern)
+
+    def apply_updates(self):
+        with self.lock:
+            try:
+                if not self.pubsub:
+                    self.pubsub = self.redis.pubsub()
+                    self.pubsub.subscribe(self.UPDATE_CHANNEL)
+
+                    # any updates made while not subscribed are missed
+                    self.paths.clear()
+                    self.key_sets.clear()
+
+                while True:
+                    msg = self.pubsub.get_message()
+                    if not msg:
+                        break
+
+                    if msg['type'] == 'message':
+                        data = msg['data']
+                        if six.PY3:
+                            data = data.decode('utf-8')
+
+                        self.apply_update(*json.loads(data))
+
+            except Exception:
+                self.pubsub = None
+
+    def apply_update(self, file_key, filename):
+        self.paths.pop((file_key, filename), None)
+
+        for pattern, entry in list(self.key_sets.items()):
+            if not fnmatch.fnmatchcase(file_key, pattern):
+                continue
+
+            self.paths.pop((pattern, filename), None)
+
+            if file_key not in entry[0]:
+                entry[0] = sorted(entry[0] + [file_key])
+
+    @staticmethod
+    def make_update(file_key, filename):
+        return json.dumps([file_key, filename])
+
+
+#=============================================================================
+class RedisDigestIndex(RedisIndexSource):
+    """ Redis hash of payload digest -> location of the original record,
+    written by the recorder, used to resolve revisits without an index
+    query. Found locations never change, and are kept in an LRU
+    """
+    def __init__(self, redis_url, redis=None, key_template=None, max_size=10000):
+        super(RedisDigestIndex, self).__init__(redis_url, redis, key_template)
+        self.max_size = max_size
+        self.cache = OrderedDict()
+
+    @staticmethod
+    def to_location(filename, offset, length):
+        return ' '.join((filename, offset, length))
+
+    def __call__(self, digest, formatter=None):
+        redis_key = self.redis_key_template
+        if formatter:
+            redis_key = formatter.format(redis_key)
+
+        digest = digest.split(':')[-1]
+        key = (redis_key, digest)
+
+        location = self.cache.pop(key, None)
+        if location is None:
+            location = self.redis.hget(redis_key, digest)
+            if not location:
+                return None
+
+            if six.PY3:
+                location = location.decode('utf-8')
+
+            while len(self.cache) >= self.max_size:
+                self.cache.popitem(last=False)
+
+        self.cache[key] = location
+
+        cdx = CDXObject()
+        cdx['filename'], cdx['offset'], cdx['length'] = location.rsplit(' ', 2)
+        cdx['digest'] = digest
+        cdx._formatter = formatter
+        return cdx
+
 
 #=============================================================================
 class WARCPathLoader(BaseLoader):
-    def __init__(self, paths, cdx_source):
+    # max size of WARC headers checked when serving a file range
+    MAX_HEADERS_SIZE = 65536
+
+    RANGE_HEADER = re.compile(r'bytes=(\d+)-(\d+)?$')
+
+    def __init__(self, paths, cdx_source, remote_store=None, digest_index=None,
+                 seek_indexes=None):
         self.paths = paths
         if isinstance(paths, six.string_types):
             self.paths = [paths]
 
         self.resolvers = [self._make_resolver(path) for path in self.paths]
 
+        # http(s) WARCs loaded through the remote store, if set
+        block_loader = PooledBlockLoader(remote_store=remote_store)
+        record_loader = ArcWarcRecordLoader(loader=block_loader)
+
         self.resolve_loader = ResolvingLoader(self.resolvers,
+                                              record_loader=record_loader,
                                               no_record_parse=True)
 
         self.headers_parser = StatusAndHeadersParser([], verify=False)
 
         self.cdx_source = cdx_source
 
+        if isinstance(digest_index, six.string_types):
+            digest_index = RedisDigestIndex(digest_index)
+
+        self.digest_index = digest_index
+
+        # if set, Range requests for local records are answered directly
+        if seek_indexes is True:
+            seek_indexes = SeekIndexCache()
+
+        self.seek_indexes = seek_indexes
+
     def _make_resolver(self, path):
         if hasattr(path, '__call__'):
             return path
@@ -191,6 +410,11 @@ class WARCPathLoader(BaseLoader):
         cdx._formatter = formatter
 
         def local_index_query(local_params):
+            # original from digest index, if any, tried first
+            orig_cdx = self.lookup_digest(local_params, formatter)
+            if orig_cdx:
+                yield orig_cdx
+
             for n, v in six.iteritems(params):
                 if n.startswith('param.'):
                     local_params[n] = v
@@ -235,8 +459,188 @@ class WARCPathLoader(BaseLoader):
 
             headers.stream.close()
 
+        else:
+            req_range = self.get_request_range(params)
+            if req_range and status == '200' and payload.rec_type == 'response':
+                status_headers = self.headers_parser.parse(payload.stream)
+                res = self.load_range(cdx, payload, status_headers, *req_range)
+                if res:
+                    payload.stream.close()
+                    return (warc_headers,) + res
+
+                http_headers_buff = status_headers.to_bytes()
+
+            file_range = self.get_file_range(cdx, payload)
+            if file_range:
+                payload.stream.close()
+                return (warc_headers, http_headers_buff, file_range)
+
         return (warc_headers, http_headers_buff, payload.stream)
 
+    def lookup_digest(self, local_params, formatter):
+        if not self.digest_index:
+            return None
+
+        for filter_ in local_params.get('filter', []):
+            if filter_.startswith('digest:'):
+                return self.digest_index(filter_[len('digest:'):], formatter)
+
+        return None
+
+    def get_local_path(self, filename, cdx):
+        for resolver in self.resolvers:
+            paths = resolver(filename, cdx)
+            if not paths:
+                continue
+
+            if isinstance(paths, six.string_types):
+                paths = [paths]
+
+            for path in paths:
+                if path.startswith('file://'):
+                    path = url2pathname(path[len('file://'):])
+                elif '://' in path:
+                    continue
+
+                if os.path.isfile(path):
+                    return path
+
+        return None
+
+    def get_file_range(self, cdx, record):
+        """ If the record is in an uncompressed, local WARC, return
+        a FileRange for the unread remainder of the record block,
+        which can be sent as is
+        """
+        if record.format != 'warc' or not isinstance(record.stream, LimitReader):
+            return None
+
+        try:
+            offset = int(cdx['offset'])
+        except (KeyError, TypeError, ValueError):
+            return None
+
+        path = self.get_local_path(cdx['filename'], cdx)
+        if not path:
+            return None
+
+        try:
+            with closing(WARC_FILE_POOL.open(path, offset)) as fh:
+                buff = fh.read(self.MAX_HEADERS_SIZE)
+        except (IOError, OSError):
+            return None
+
+        # gzip member or not the expected record
+        if not buff.startswith(b'WARC/'):
+            return None
+
+        start = self._get_remainder_start(record, buff)
+        if start is None:
+            return None
+
+        return FileRange(path, offset + start, record.stream.limit)
+
+    def _get_remainder_start(self, record, buff):
+        """ Return offset of the unread remainder of the record block,
+        from the start of the record, given its start in buff
+        """
+        try:
+            content_len = int(record.rec_headers.get_header('Content-Length'))
+        except (TypeError, ValueError):
+            return None
+
+        headers_end = buff.find(b'\r\n\r\n')
+        if headers_end < 0 or b'\n\n' in buff[:headers_end]:
+            return None
+
+        return headers_end + 4 + content_len - record.stream.limit
+
+    def get_request_range(self, params):
+        """ Return (start, end) for a single Range request, end may be None
+        """
+        if not self.seek_indexes:
+            return None
+
+        input_req = params.get('_input_req')
+        if not input_req:
+            return None
+
+        m = self.RANGE_HEADER.match(input_req._get_header('Range') or '')
+        if not m:
+            return None
+
+        end = m.group(2)
+        return int(m.group(1)), int(end) if end else None
+
+    def load_range(self, cdx, record, status_headers, start, end):
+        """ Return http headers and stream for a range of the payload,
+        if it can be read directly from a local WARC
+        """
+        if status_headers.get_header('Transfer-Encoding'):
+            return None
+
+        if record.format != 'warc' or not isinstance(record.stream, LimitReader):
+            return None
+
+        total_len = record.stream.limit
+        if end is None or end >= total_len:
+            end = total_len - 1
+
+        if start > end:
+            return None
+
+        part_len = end - start + 1
+
+        stream = self.get_range_stream(cdx, record, start, part_len)
+        if not stream:
+            return None
+
+        status_headers.add_range(start, part_len, total_len)
+        status_headers.replace_header('Content-Length', str(part_len))
+        http_headers_buff = status_headers.to_bytes()
+
+        record.rec_headers.replace_header('Content-Length',
+                                          str(len(http_headers_buff) + part_len))
+
+        return http_headers_buff, stream
+
+    def get_range_stream(self, cdx, record, start, length):
+        try:
+            offset = int(cdx['offset'])
+            comp_len = int(cdx['length'])
+        except (KeyError, TypeError, ValueError):
+            return None
+
+        path = self.get_local_path(cdx['filename'], cdx)
+        if not path:
+            return None
+
+        try:
+            with closing(WARC_FILE_POOL.open(path, offset)) as fh:
+                magic = fh.read(2)
+        except (IOError, OSError):
+            return None
+
+        # uncompressed WARC
+        if magic != b'\x1f\x8b':
+            file_range = self.get_file_range(cdx, record)
+            if not file_range:
+                return None
+
+            return FileRange(path, file_range.offset + start, length)
+
+        index = self.seek_indexes.get(path, offset, comp_len)
+
+        buff = b''.join(index.iter_range(0, self.MAX_HEADERS_SIZE))
+        if not buff.startswith(b'WARC/'):
+            return None
+
+        remainder_start = self._get_remainder_start(record, buff)
+        if remainder_start is None:
+            return None
+
+        return index.open(remainder_start + start, length)
+
     def __str__(self):
         return  'WARCPathLoader'
 
@@ -248,13 +652,18 @@ class LiveWebLoader(BaseLoader):
                     'content-location',
                     'x-archive')
 
-    def __init__(self):
-        self.num_retries = 3
-        self.num_pools = 10
-        self.num_conn_per_pool = 10
+    def __init__(self, pool=None, num_retries=3, num_pools=10,
+                 num_conn_per_pool=10, **pool_kwargs):
+        self.num_retries = num_retries
+        self.num_pools = num_pools
+        self.num_conn_per_pool = num_conn_per_pool
+
+        if not pool:
+            pool = LivePoolManager(num_pools=self.num_pools,
+                                   maxsize=self.num_conn_per_pool,
+                                   **pool_kwargs)
 
-        self.pool = urllib3.PoolManager(num_pools=self.num_pools,
-                                        maxsize=self.num_conn_per_pool)
+        self.pool = pool
 
     def load_resource(self, cdx, params):
         load_url = cdx.get('load_url')
@@ -268,25 +677,16 @@ class LiveWebLoader(BaseLoader):
 
         req_headers = input_req.get_req_headers()
 
-        dt = timestamp_to_datetime(cdx['timestamp'])
-
         if cdx.get('memento_url'):
-            req_headers['Accept-Datetime'] = datetime_to_http_date(dt)
+            req_headers['Accept-Datetime'] = timestamp_to_http_date(cdx['timestamp'])
 
         method = input_req.get_req_method()
         data = input_req.get_req_body()
 
-        p = PreparedRequest()
-        p.prepare_url(load_url, None)
-        p.prepare_headers(None)
-        p.prepare_auth(None, load_url)
-
-        auth = p.headers.get('Authorization')
+        load_url, auth = self.prepare_url(load_url)
         if auth:
             req_headers['Authorization'] = auth
 
-        load_url = p.url
-
         try:
             upstream_res = self.pool.urlopen(method=method,
                                              url=load_url,
@@ -304,8 +704,7 @@ class LiveWebLoader(BaseLoader):
 
         memento_dt = upstream_res.headers.get('Memento-Datetime')
         if memento_dt:
-            dt = http_date_to_datetime(memento_dt)
-            cdx['timestamp'] = datetime_to_timestamp(dt)
+            cdx['timestamp'] = http_date_to_timestamp(memento_dt)
         elif cdx.get('memento_url'):
         # if 'memento_url' set and no Memento-Datetime header present
         # then its an error
@@ -368,7 +767,7 @@ class LiveWebLoader(BaseLoader):
         warc_headers['WARC-Type'] = 'response'
         warc_headers['WARC-Record-ID'] = self._make_warc_id()
         warc_headers['WARC-Target-URI'] = cdx['url']
-        warc_headers['WARC-Date'] = datetime_to_iso_date(dt)
+        warc_headers['WARC-Date'] = timestamp_to_iso_date(cdx['timestamp'])
         if remote_ip:
             warc_headers['WARC-IP-Address'] = remote_ip
 
@@ -381,6 +780,21 @@ class LiveWebLoader(BaseLoader):
         warc_headers = StatusAndHeaders('WARC/1.0', warc_headers.items())
         return (warc_headers, http_headers_buff, upstream_res)
 
+    @staticmethod
+    def prepare_url(url):
+        """ Return normalized url, and Authorization header for
+        any credentials in the url
+        """
+        p = PreparedRequest()
+        p.prepare_url(url, None)
+
+        if '@' not in url:
+            return p.url, None
+
+        p.prepare_headers(None)
+        p.prepare_auth(None, url)
+        return p.url, p.headers.get('Authorization')
+
     def __str__(self):
         return  'LiveWebLoader'
 
@@ -421,12 +835,10 @@ class VideoLoader(BaseLoader):
         schema, rest = load_url.split('://', 1)
         target_url = 'metadata://' + rest
 
-        dt = timestamp_to_datetime(cdx['timestamp'])
-
         warc_headers['WARC-Type'] = 'metadata'
         warc_headers['WARC-Record-ID'] = self._make_warc_id()
         warc_headers['WARC-Target-URI'] = target_url
-        warc_headers['WARC-Date'] = datetime_to_iso_date(dt)
+        warc_headers['WARC-Date'] = timestamp_to_iso_date(cdx['timestamp'])
         warc_headers['Content-Type'] = self.CONTENT_TYPE
         warc_headers['Content-Length'] = str(len(info_buff))
 
@@ -434,3 +846,75 @@ class VideoLoader(BaseLoader):
 
         return warc_headers, None, BytesIO(info_buff)
 
+    def __str__(self):
+        return 'VideoLoader'
+
+
+#=============================================================================
+class CachingLoader(BaseLoader):
+    """ Wraps a loader, serving frequently requested archived records
+    from a RecordCache, keyed by (filename, offset, length)
+
+    Only complete records with a known Content-Length, up to the cache's
+    max item size, are cached. Records which may be redirects are always
+    loaded, as they must be checked against the requested url, as are
+    Range requests.
+    """
+    def __init__(self, loader, cache=None):
+        self.loader = loader
+        self.cache = cache or RecordCache()
+
+    def get_key(self, cdx):
+        if cdx.get('_cached_result') or cdx.get('is_live'):
+            return None
+
+        filename = cdx.get('filename')
+        offset = cdx.get('offset')
+        if not filename or offset is None:
+            return None
+
+        status = cdx.get('status')
+        if not status or status.startswith('3'):
+            return None
+
+        # same filename may resolve to different paths for each source
+        return self.cache.make_key(filename, offset, cdx.get('length', ''),
+                                   cdx.get('source', ''))
+
+    @staticmethod
+    def is_range_request(params):
+        input_req = params.get('_input_req')
+        return input_req is not None and input_req._get_header('Range')
+
+    def __call__(self, cdx, params):
+        key = self.get_key(cdx)
+        if not key or self.is_range_request(params):
+            return self.loader(cdx, params)
+
+        headers, record = self.cache.get(key)
+        if headers is not None:
+            return dict(headers), [record]
+
+        out_headers, resp = self.loader(cdx, params)
+        if resp is None:
+            return out_headers, resp
+
+        try:
+            size = int(out_headers.get('Content-Length'))
+        except (TypeError, ValueError):
+            return out_headers, resp
+
+        if not self.cache.is_cacheable(size):
+            return out_headers, resp
+
+        try:
+            record = b''.join(resp)
+        finally:
+            if hasattr(resp, 'close'):
+                resp.close()
+
+        self.cache.put(key, dict(out_headers), record)
+        return out_headers, [record]
+
+    def __str__(self):
+        return str(self.loader)
@@ -0,0 +1,132 @@
+from webagg.filepool import WARC_FILE_POOL
+
+from collections import OrderedDict
+from contextlib import closing
+
+import bisect
+import threading
+import zlib
+
+
+#=============================================================================
+class GzipSeekIndex(object):
+    """ Random access into a single gzip member, zran-style
+
+    The decompressor state is copied about every 'spacing' bytes of
+    output, together with the input offset it was reached at. Reads
+    resume from the nearest checkpoint before the requested offset,
+    instead of from the start of the member. Checkpoints are added as
+    the member is read, so the index is built by the first reads.
+    """
+    READ_SIZE = 65536
+
+    def __init__(self, path, offset, length, spacing=4 * 1024 * 1024,
+                 pool=None):
+        self.path = path
+        self.offset = offset
+        self.length = length
+        self.spacing = spacing
+        self.pool = pool or WARC_FILE_POOL
+
+        # output offsets, and matching (input offset, decompressor)
+        self.out_points = [0]
+        self.points = [(0, zlib.decompressobj(16 + zlib.MAX_WBITS))]
+
+        self.lock = threading.Lock()
+
+    def _add_point(self, out_pos, in_pos, decomp):
+        with self.lock:
+            if out_pos >= self.out_points[-1] + self.spacing:
+                self.out_points.append(out_pos)
+                self.points.append((in_pos, decomp.copy()))
+
+    def iter_range(self, start, length):
+        """ Iterate over decompressed bytes [start, start + length)
+        """
+        with self.lock:
+            i = bisect.bisect_right(self.out_points, start) - 1
+            out_pos = self.out_points[i]
+            in_pos, decomp = self.points[i]
+            decomp = decomp.copy()
+
+        end = start + length
+
+        with closing(self.pool.open(self.path, self.offset + in_pos,
+                                    self.length - in_pos)) as fh:
+            while out_pos < end and not decomp.eof:
+                buff = fh.read(self.READ_SIZE)
+                if not buff:
+                    break
+
+                in_pos += len(buff)
+                data = decomp.decompress(buff)
+
+                data_start = out_pos
+                out_pos += len(data)
+
+                self._add_point(out_pos, in_pos, decomp)
+
+                if out_pos <= start:
+                    continue
+
+                yield data[max(start - data_start, 0):end - data_start]
+
+    def open(self, start, length):
+        return IterReader(self.iter_range(start, length))
+
+
+#=============================================================================
+class IterReader(object):
+    """ Minimal file-like reader over an iterator of byte chunks
+    """
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.buff = b''
+
+    def read(self, size=-1):
+        while size is None or size < 0 or len(self.buff) < size:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                break
+
+            self.buff += chunk
+
+        if size is None or size < 0:
+            size = len(self.buff)
+
+        data = self.buff[:size]
+        self.buff = self.buff[size:]
+        return data
+
+    def close(self):
+        if hasattr(self.chunks, 'close'):
+            self.chunks.close()
+
+        self.buff = b''
+
+
+#=============================================================================
+class SeekIndexCache(object):
+    """ LRU of GzipSeekIndex for recently read records,
+    by (path, offset, length)
+    """
+    def __init__(self, spacing=4 * 1024 * 1024, max_size=64):
+        self.spacing = spacing
+        self.max_size = max_size
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, path, offset, length):
+        key = (path, offset, length)
+
+        with self.lock:
+            index = self.cache.pop(key, None)
+            if not index:
+                index = GzipSeekIndex(path, offset, length, self.spacing)
+
+                while len(self.cache) >= self.max_size:
+                    self.cache.popitem(last=False)
+
+            self.cache[key] = index
+
+        return index
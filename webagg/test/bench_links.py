@@ -0,0 +1,159 @@
+"""
+Micro-benchmark for Link-format parsing, timemap serialization and
+date conversion, comparing MementoUtils and webagg.dateutils against the previous regex split implementation
+
+python -m webagg.test.bench_links [num_mementos]
+"""
+
+from webagg.utils import MementoUtils, MementoException
+from webagg import dateutils
+
+from pywb.utils.timeutils import timestamp_to_http_date, http_date_to_timestamp
+
+import datetime
+import re
+import sys
+import time
+
+
+LINK_SPLIT = re.compile(',\s*(?=[<])')
+LINK_SEG_SPLIT = re.compile(';\s*')
+LINK_URL = re.compile('<(.*)>')
+LINK_PROP = re.compile('([\w]+)="([^"]+)')
+
+
+#=============================================================================
+def legacy_parse_links(link_header, def_name='timemap'):
+    links = LINK_SPLIT.split(link_header)
+    results = {}
+    mementos = []
+
+    for link in links:
+        props = LINK_SEG_SPLIT.split(link)
+        m = LINK_URL.match(props[0])
+        if not m:
+            raise MementoException('Invalid Link Url: ' + props[0])
+
+        result = dict(url=m.group(1))
+        key = ''
+        is_mem = False
+
+        for prop in props[1:]:
+            m = LINK_PROP.match(prop)
+            if not m:
+                raise MementoException('Invalid prop ' + prop)
+
+            name = m.group(1)
+            value = m.group(2)
+
+            if name == 'rel':
+                if 'memento' in value:
+                    is_mem = True
+                    result[name] = value
+                elif value == 'self':
+                    key = def_name
+                else:
+                    key = value
+            else:
+                result[name] = value
+
+        if key:
+            results[key] = result
+        elif is_mem:
+            mementos.append(result)
+
+    results['mementos'] = mementos
+    return results
+
+
+def legacy_make_timemap_memento_link(cdx, datetime=None, rel='memento', end=',\n'):
+    url = cdx.get('load_url')
+    if not url:
+        url = 'file://{0}:{1}:{2}'.format(cdx.get('filename'), cdx.get('offset'), cdx.get('length'))
+
+    memento = '<{0}>; rel="{1}"; datetime="{2}"; src="{3}"' + end
+
+    if not datetime:
+        datetime = timestamp_to_http_date(cdx['timestamp'])
+
+    return memento.format(url, rel, datetime, cdx.get('source', ''))
+
+
+def legacy_make_timemap(cdx_iter):
+    try:
+        first_cdx = next(cdx_iter)
+        from_date = timestamp_to_http_date(first_cdx['timestamp'])
+    except StopIteration:
+        return
+
+    yield legacy_make_timemap_memento_link(first_cdx, datetime=from_date)
+
+    prev_cdx = None
+
+    for cdx in cdx_iter:
+        if prev_cdx:
+            yield legacy_make_timemap_memento_link(prev_cdx)
+
+        prev_cdx = cdx
+
+    if prev_cdx:
+        yield legacy_make_timemap_memento_link(prev_cdx, end='\n')
+
+
+#=============================================================================
+def make_cdxs(num):
+    start = datetime.datetime(2014, 1, 1)
+    for i in range(num):
+        ts = (start + datetime.timedelta(minutes=i * 7)).strftime('%Y%m%d%H%M%S')
+        yield dict(timestamp=ts,
+                   load_url='http://archive.example.com/' + ts + '/http://example.com/',
+                   source='bench')
+
+
+def make_timemap_text(num):
+    return ('<http://example.com/>; rel="original",\n' +
+            ''.join(MementoUtils.make_timemap(make_cdxs(num))))
+
+
+def iter_chunks(data, size=16384):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+def timed(name, func):
+    start = time.time()
+    res = func()
+    print('{0:<36} {1:8.3f}s'.format(name, time.time() - start))
+    return res
+
+
+def main(num):
+    print('{0} mementos'.format(num))
+
+    timed('make_timemap (legacy)', lambda: ''.join(legacy_make_timemap(make_cdxs(num))))
+    timed('make_timemap', lambda: ''.join(MementoUtils.make_timemap(make_cdxs(num))))
+
+    timestamps = [cdx['timestamp'] for cdx in make_cdxs(num)]
+    timed('timestamp_to_http_date (legacy)', lambda: [timestamp_to_http_date(ts) for ts in timestamps])
+    dates = timed('timestamp_to_http_date', lambda: [dateutils.timestamp_to_http_date(ts) for ts in timestamps])
+    timed('http_date_to_timestamp (legacy)', lambda: [http_date_to_timestamp(dt) for dt in dates])
+    timed('http_date_to_timestamp', lambda: [dateutils.http_date_to_timestamp(dt) for dt in dates])
+
+    text = make_timemap_text(num)
+    data = text.encode('utf-8')
+    print('{0} bytes'.format(len(data)))
+
+    old = timed('parse_links (legacy)', lambda: legacy_parse_links(text))
+    new = timed('parse_links', lambda: MementoUtils.parse_links(text))
+    assert(old == new)
+
+    # streaming: count only, no list of mementos held
+    def count_streamed():
+        return sum(1 for key, _ in MementoUtils.iter_links(iter_chunks(data))
+                   if key == 'memento')
+
+    assert(timed('iter_links (16K chunks)', count_streamed) == num)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
@@ -0,0 +1,48 @@
+from webagg.dateutils import timestamp_to_http_date, http_date_to_timestamp
+from webagg.dateutils import timestamp_to_iso_date, iso_date_to_timestamp
+from webagg.dateutils import iso_date_to_http_date
+
+from pywb.utils import timeutils
+
+import pytest
+
+
+TIMESTAMPS = ['20131226095000',
+              '20140126200804',
+              '20140126200804123456',
+              '20000229235959',
+              '19991231000000',
+
+              # padded or clamped by pywb
+              '2014',
+              '201412260950',
+              '20131709005601',
+              '20150229120000',
+              '20141226256161',
+              '18991231000000',
+              '2010abc',
+              '']
+
+
+# ============================================================================
+@pytest.mark.parametrize("timestamp", TIMESTAMPS)
+def test_timestamp_same_as_pywb(timestamp):
+    # twice, with and without the memoized date
+    for i in range(2):
+        assert(timestamp_to_http_date(timestamp) == timeutils.timestamp_to_http_date(timestamp))
+        assert(timestamp_to_iso_date(timestamp) == timeutils.timestamp_to_iso_date(timestamp))
+
+    http_date = timeutils.timestamp_to_http_date(timestamp)
+    assert(http_date_to_timestamp(http_date) == timeutils.http_date_to_timestamp(http_date))
+
+    iso_date = timeutils.timestamp_to_iso_date(timestamp)
+    assert(iso_date_to_timestamp(iso_date) == timeutils.iso_date_to_timestamp(iso_date))
+    assert(iso_date_to_http_date(iso_date) == http_date)
+
+
+def test_other_date_formats():
+    assert(http_date_to_timestamp('Sunday, 26-Jan-14 20:08:04 GMT') == '20140126200804')
+    assert(iso_date_to_timestamp('2013-12-26T10:11:12') == '20131226101112')
+
+    with pytest.raises(ValueError):
+        http_date_to_timestamp('Thu, 31 Feb 2013 09:50:00 GMT')
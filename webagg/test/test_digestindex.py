@@ -0,0 +1,70 @@
+from webagg.handlers import DefaultResourceHandler
+from webagg.indexsource import FileIndexSource
+from webagg.aggregator import SimpleAggregator
+from webagg.app import ResAggApp
+from webagg.responseloader import RedisDigestIndex
+
+from fakeredis import FakeStrictRedis
+
+from .testutils import to_path, FakeRedisTests, TempDirTests, BaseTestClass
+
+import webtest
+import os
+
+
+# ============================================================================
+class TestDigestIndex(FakeRedisTests, TempDirTests, BaseTestClass):
+    @classmethod
+    def setup_class(cls):
+        super(TestDigestIndex, cls).setup_class()
+
+        # index with only the revisit, original not indexed
+        cdx_path = os.path.join(cls.root_dir, 'revisit-only.cdxj')
+        with open(to_path('testdata/url-agnost-example.cdxj'), 'rb') as fh:
+            with open(cdx_path, 'wb') as out:
+                out.write(fh.readline())
+
+        source = SimpleAggregator({'url-agnost': FileIndexSource(cdx_path)})
+        full_source = SimpleAggregator({'url-agnost': FileIndexSource(to_path('testdata/url-agnost-example.cdxj'))})
+
+        cls.digest_index = RedisDigestIndex('redis://localhost/2/test:{arg}:digests')
+
+        app = ResAggApp()
+        app.add_route('/full', DefaultResourceHandler(full_source, 'redis://localhost/2/test:{arg}:warc'))
+        app.add_route('/nodigest', DefaultResourceHandler(source, 'redis://localhost/2/test:{arg}:warc'))
+        app.add_route('/digest', DefaultResourceHandler(source, 'redis://localhost/2/test:{arg}:warc',
+                                                        digest_index=cls.digest_index))
+        cls.testapp = webtest.TestApp(app)
+
+        f = FakeStrictRedis.from_url('redis://localhost/2')
+        f.hset('test:foo:warc', 'example-url-agnostic-revisit.warc.gz', to_path('testdata/example-url-agnostic-revisit.warc.gz'))
+        f.hset('test:foo:warc', 'example-url-agnostic-orig.warc.gz', to_path('testdata/example-url-agnostic-orig.warc.gz'))
+        f.hset('test:foo:digests', 'B2LTWWPUOYAH7UIPQ7ZUPQ4VMBSVC36A',
+               RedisDigestIndex.to_location('example-url-agnostic-orig.warc.gz', '353', '1001'))
+
+    def test_revisit_no_original(self):
+        resp = self.testapp.get('/nodigest/resource?url=http://example.com/&param.arg=foo', status=503)
+
+    def test_revisit_from_digest_index(self):
+        resp = self.testapp.get('/digest/resource?url=http://example.com/&param.arg=foo')
+        resp_full = self.testapp.get('/full/resource?url=http://example.com/&param.arg=foo')
+
+        assert resp.headers['WebAgg-Source-Coll'] == 'url-agnost'
+        assert resp.headers['Memento-Datetime'] == 'Mon, 29 Jul 2013 19:51:51 GMT'
+        assert b'WARC-Refers-To-Target-URI: http://example.iana.org/' in resp.body
+        assert resp.body == resp_full.body
+
+        assert list(self.digest_index.cache.keys()) == [('test:foo:digests', 'B2LTWWPUOYAH7UIPQ7ZUPQ4VMBSVC36A')]
+
+    def test_lookup(self):
+        cdx = self.digest_index('sha1:B2LTWWPUOYAH7UIPQ7ZUPQ4VMBSVC36A')
+        assert cdx is None
+
+        digest_index = RedisDigestIndex('redis://localhost/2/test:foo:digests')
+        cdx = digest_index('sha1:B2LTWWPUOYAH7UIPQ7ZUPQ4VMBSVC36A')
+        assert cdx['filename'] == 'example-url-agnostic-orig.warc.gz'
+        assert cdx['offset'] == '353'
+        assert cdx['length'] == '1001'
+
+        assert digest_index('ABC') is None
+        assert len(digest_index.cache) == 1
@@ -0,0 +1,131 @@
+from webagg.handlers import DefaultResourceHandler
+from webagg.indexsource import FileIndexSource
+from webagg.aggregator import SimpleAggregator
+from webagg.app import ResAggApp
+from webagg.utils import FileRange
+from webagg.filepool import FilePool, PooledBlockLoader, WARC_FILE_POOL
+
+from pywb.warc.cdxindexer import write_cdx_index
+
+from wsgiref.util import FileWrapper
+
+from .testutils import to_path, TempDirTests, BaseTestClass
+
+import webtest
+import pytest
+import gzip
+import os
+
+
+# ============================================================================
+class TestFileRange(TempDirTests, BaseTestClass):
+    @classmethod
+    def setup_class(cls):
+        super(TestFileRange, cls).setup_class()
+
+        # uncompressed copy of example.warc.gz, and its index
+        warc_path = os.path.join(cls.root_dir, 'example.warc')
+        with gzip.open(to_path('testdata/example.warc.gz'), 'rb') as fh:
+            with open(warc_path, 'wb') as out:
+                out.write(fh.read())
+
+        cdx_path = os.path.join(cls.root_dir, 'example.cdxj')
+        with open(warc_path, 'rb') as fh:
+            with open(cdx_path, 'wb') as out:
+                write_cdx_index(out, fh, 'example.warc', cdxj=True, sort=True)
+
+        gz_source = SimpleAggregator({'example': FileIndexSource(to_path('testdata/example.cdxj'))})
+        source = SimpleAggregator({'example': FileIndexSource(cdx_path)})
+
+        cls.handler = DefaultResourceHandler(source, cls.root_dir + os.path.sep)
+
+        app = ResAggApp()
+        app.add_route('/gz', DefaultResourceHandler(gz_source, to_path('testdata/')))
+        app.add_route('/plain', cls.handler)
+        cls.testapp = webtest.TestApp(app)
+
+        app = ResAggApp(sendfile=True)
+        app.add_route('/plain', cls.handler)
+        cls.sendfile_app = webtest.TestApp(app, extra_environ={'wsgi.file_wrapper': FileWrapper})
+
+    def test_same_as_compressed(self):
+        for url in ('http://example.com/', 'http://www.example.com/'):
+            resp_gz = self.testapp.get('/gz/resource', params={'url': url})
+            resp = self.testapp.get('/plain/resource', params={'url': url})
+
+            assert resp.body == resp_gz.body
+            assert resp.headers['Content-Length'] == str(len(resp.body))
+            assert resp.headers['Memento-Datetime'] == resp_gz.headers['Memento-Datetime']
+
+    def test_file_range_returned(self):
+        out_headers, res, errs = self.handler(dict(url='http://example.com/', mode='resource'))
+        assert isinstance(res, FileRange)
+        assert res.filename.endswith('example.warc')
+
+        body = b''.join(res)
+        assert body.startswith(b'WARC/1.0\r\n')
+        assert b'HTTP/1.1 200 OK' in body
+        assert res.fh is None
+
+    def test_file_wrapper(self):
+        resp_gz = self.testapp.get('/gz/resource', params={'url': 'http://example.com/'})
+        resp = self.sendfile_app.get('/plain/resource', params={'url': 'http://example.com/'})
+
+        assert resp.body == resp_gz.body
+
+    def test_pooled_handles(self):
+        WARC_FILE_POOL.clear()
+
+        for i in range(3):
+            resp = self.testapp.get('/gz/resource', params={'url': 'http://example.com/'})
+            assert resp.headers['WebAgg-Type'] == 'warc'
+
+        assert list(WARC_FILE_POOL.files.keys()) == [to_path('testdata/example.warc.gz')]
+        assert WARC_FILE_POOL.files[to_path('testdata/example.warc.gz')].refs == 0
+
+    def test_pool_lru_and_stale(self):
+        pool = FilePool(max_open=2)
+        names = []
+        for i in range(3):
+            name = os.path.join(self.root_dir, 'pool-{0}.txt'.format(i))
+            with open(name, 'wb') as fh:
+                fh.write(b'file ' + str(i).encode('utf-8') + b'\nline 2\n')
+            names.append(name)
+
+        reader = pool.open(names[0], 5, 1)
+        assert reader.read() == b'0'
+
+        pool.open(names[1]).close()
+        pool.open(names[2]).close()
+
+        # evicted, but still open until released
+        assert list(pool.files.keys()) == names[1:]
+        assert reader.read() == b''
+        fd = reader.pfile.fd
+        os.fstat(fd)
+        reader.close()
+        with pytest.raises(OSError):
+            os.fstat(fd)
+
+        # replaced file reopened
+        reader = pool.open(names[1])
+        assert reader.readline() == b'file 1\n'
+        assert reader.readline() == b'line 2\n'
+        reader.close()
+
+        temp = names[1] + '.tmp'
+        with open(temp, 'wb') as fh:
+            fh.write(b'new file\n')
+        os.rename(temp, names[1])
+
+        assert pool.open(names[1]).read() == b'new file\n'
+
+        with pytest.raises(IOError):
+            pool.open(self.root_dir)
+
+        loader = PooledBlockLoader(pool)
+        with pytest.raises(IOError):
+            loader.load(os.path.join(self.root_dir, 'not-found'))
+
+        pool.clear()
+        assert len(pool.files) == 0
@@ -436,6 +436,31 @@ host: www.youtube.com\
 
         assert 'ResErrors' not in resp.headers
 
+    def test_explain_index_local(self):
+        resp = self.testapp.get('/many/index?url=http://www.example.com/&sources=local&explain=1')
+
+        res = resp.json['explain']
+        assert res['lines'] == 4
+        assert set(res['stages'].keys()) == set(['merge', 'process_cdx', 'fuzzy', 'serialize'])
+
+        assert res['sources']['local']['lines_scanned'] == 4
+        assert res['sources']['local']['lines_returned'] == 4
+        assert res['sources']['local:dupes.cdxj']['lines_returned'] == 2
+        assert res['sources']['local:dupes.cdxj']['bytes_read'] > 0
+        assert res['sources']['local:dupes.cdxj']['timeout'] == False
+
+        assert resp.headers['Server-Timing'].startswith('total;dur=')
+        assert 'source;desc="local:example.cdxj"' in resp.headers['Server-Timing']
+
+    def test_explain_resource_local(self):
+        resp = self.testapp.get('/fallback/resource?url=http://www.example.com/&explain=1')
+
+        assert resp.headers['WebAgg-Source-Coll'] == 'example'
+        assert 'source;desc="example"' in resp.headers['Server-Timing']
+        assert 'load;desc="WARCPathLoader"' in resp.headers['Server-Timing']
+
+        assert b'HTTP/1.1 200 OK' in resp.body
+
     def test_error_invalid_index_output(self):
         resp = self.testapp.get('/live/index?url=http://httpbin.org/get&output=foobar', status=400)
 
@@ -0,0 +1,222 @@
+from webagg.httpcache import HttpCache, parse_cache_control
+from webagg.httpclient import RemoteHttpClient
+from webagg.indexsource import MementoIndexSource, TimemapCache
+from webagg.aggregator import SimpleAggregator
+
+from requests.structures import CaseInsensitiveDict
+
+from .testutils import TempDirTests, BaseTestClass, key_ts_res
+
+import time
+
+
+# ============================================================================
+TIMEMAP = b"""\
+<http://example.com/>; rel="original",
+<http://archive.example.com/web/timemap/link/http://example.com/>; rel="self"; type="application/link-format",
+<http://archive.example.com/web/20140127171200/http://example.com/>; rel="memento"; datetime="Mon, 27 Jan 2014 17:12:00 GMT",
+<http://archive.example.com/web/20160225042329/http://example.com/>; rel="memento"; datetime="Thu, 25 Feb 2016 04:23:29 GMT"
+"""
+
+
+# ============================================================================
+class FakeResponse(object):
+    def __init__(self, status_code, headers, content=b''):
+        self.status_code = status_code
+        self.headers = CaseInsensitiveDict(headers)
+        self.content = content
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8')
+
+    def iter_content(self, chunk_size=1):
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i:i + chunk_size]
+
+    def close(self):
+        pass
+
+
+class FakeClient(RemoteHttpClient):
+    def __init__(self, responses):
+        super(FakeClient, self).__init__()
+        self.responses = responses
+        self.requests = []
+
+    def get(self, url, timeout=None, **kwargs):
+        self.requests.append((url, kwargs.get('headers', {})))
+        return self.responses.pop(0)
+
+    head = get
+
+
+# ============================================================================
+class TestHttpCache(TempDirTests, BaseTestClass):
+    def test_cache_control(self):
+        assert parse_cache_control('public, max-age=60, s-maxage="120"') == {'public': '', 'max-age': '60', 's-maxage': '120'}
+
+    def test_fresh_until(self):
+        cache = HttpCache()
+        now = time.time()
+
+        assert cache.get_fresh_until({'Cache-Control': 'max-age=60'}, now=now) == now + 60
+        assert cache.get_fresh_until({'Cache-Control': 'max-age=60, s-maxage=10'}, now=now) == now + 10
+        assert cache.get_fresh_until({'Cache-Control': 'no-store'}, min_ttl=100, now=now) == None
+        assert cache.get_fresh_until({'Cache-Control': 'private'}, now=now) == None
+        assert cache.get_fresh_until({'Cache-Control': 'no-cache'}, now=now) == now
+        assert cache.get_fresh_until({}, min_ttl=30, now=now) == now + 30
+
+        headers = {'Date': 'Mon, 27 Jan 2014 17:00:00 GMT',
+                   'Expires': 'Mon, 27 Jan 2014 18:00:00 GMT'}
+        assert cache.get_fresh_until(headers, now=now) == now + 3600
+
+        headers = {'Date': 'Mon, 27 Jan 2014 17:00:00 GMT',
+                   'Last-Modified': 'Mon, 27 Jan 2014 07:00:00 GMT',
+                   'Age': '600'}
+        assert cache.get_fresh_until(headers, now=now) == now + 3600 - 600
+
+    def test_get_cached_revalidate(self):
+        cache = HttpCache()
+        client = FakeClient([FakeResponse(200, {'Cache-Control': 'max-age=0', 'ETag': '"abc"'}, b'data'),
+                             FakeResponse(304, {'Cache-Control': 'max-age=600'}),
+                            ])
+
+        res = client.get_cached('http://example.com/', cache)
+        assert res.content == b'data'
+        assert res.from_cache == False
+
+        # stale, revalidated with etag
+        res = client.get_cached('http://example.com/', cache)
+        assert res.content == b'data'
+        assert res.from_cache == True
+        assert client.requests[1][1] == {'If-None-Match': '"abc"'}
+
+        # now fresh from 304 headers
+        res = client.get_cached('http://example.com/', cache)
+        assert res.content == b'data'
+        assert len(client.requests) == 2
+
+    def test_get_cached_stale_on_error(self):
+        cache = HttpCache()
+        client = FakeClient([FakeResponse(200, {'Last-Modified': 'Mon, 27 Jan 2014 07:00:00 GMT', 'Cache-Control': 'no-cache'}, b'data'),
+                             FakeResponse(503, {}, b'error'),
+                            ])
+
+        assert client.get_cached('http://example.com/', cache).content == b'data'
+
+        res = client.get_cached('http://example.com/', cache)
+        assert res.content == b'data'
+        assert res.status_code == 200
+        assert client.requests[1][1] == {'If-Modified-Since': 'Mon, 27 Jan 2014 07:00:00 GMT'}
+
+    def test_get_cached_no_store(self):
+        cache = HttpCache()
+        client = FakeClient([FakeResponse(200, {'Cache-Control': 'no-store'}, b'data'),
+                             FakeResponse(200, {'Cache-Control': 'no-store'}, b'data2'),
+                            ])
+
+        assert client.get_cached('http://example.com/', cache, min_ttl=60).content == b'data'
+        assert client.get_cached('http://example.com/', cache, min_ttl=60).content == b'data2'
+        assert cache.get('http://example.com/') == (None, None)
+
+    def test_disk_tier(self):
+        cache = HttpCache(cache_dir=self.root_dir)
+        client = FakeClient([FakeResponse(200, {'Cache-Control': 'max-age=600', 'Content-Encoding': 'gzip'}, b'data')])
+
+        assert client.get_cached('http://example.com/', cache).content == b'data'
+
+        # new memory tier, loaded from disk
+        cache = HttpCache(cache_dir=self.root_dir)
+        res = FakeClient([]).get_cached('http://example.com/', cache)
+        assert res.content == b'data'
+        assert res.from_cache == True
+        assert 'Content-Encoding' not in res.headers
+
+    def test_mem_tier_size(self):
+        cache = HttpCache(max_mem_size=10)
+        cache.put('http://example.com/1', {}, b'12345')
+        cache.put('http://example.com/2', {}, b'12345')
+        cache.put('http://example.com/3', {}, b'12345')
+
+        assert cache.get('http://example.com/1') == (None, None)
+        assert cache.get('http://example.com/3') == ({}, b'12345')
+        assert cache.mem_size == 10
+
+    def test_memento_timemap_cached(self):
+        client = FakeClient([FakeResponse(200, {}, TIMEMAP)])
+
+        source = MementoIndexSource.from_timegate_url('http://archive.example.com/web/',
+                                                      client=client,
+                                                      cache=HttpCache(),
+                                                      min_ttl=60)
+
+        agg = SimpleAggregator({'source': source})
+
+        expected = """\
+com,example)/ 20140127171200 http://archive.example.com/web/20140127171200id_/http://example.com/
+com,example)/ 20160225042329 http://archive.example.com/web/20160225042329id_/http://example.com/"""
+
+        for i in range(2):
+            res, errs = agg(dict(url='http://example.com/'))
+            assert(key_ts_res(res, 'load_url') == expected)
+            assert(errs == {})
+
+        assert len(client.requests) == 1
+
+    def test_timemap_cache_closest(self):
+        timegate_link = '<http://example.com/>; rel="original", <http://archive.example.com/web/20140127171200/http://example.com/>; rel="memento"; datetime="Mon, 27 Jan 2014 17:12:00 GMT"'
+
+        client = FakeClient([FakeResponse(200, {'Link': timegate_link}),
+                             FakeResponse(200, {}, TIMEMAP)])
+
+        timemap_cache = TimemapCache(max_size=10, ttl=60)
+
+        source = MementoIndexSource.from_timegate_url('http://archive.example.com/web/',
+                                                      client=client,
+                                                      timemap_cache=timemap_cache)
+
+        agg = SimpleAggregator({'source': source})
+
+        # no timemap yet, timegate used
+        res, errs = agg(dict(url='http://example.com/', closest='20160101'))
+        assert(key_ts_res(res, 'timestamp') == 'com,example)/ 20140127171200 20140127171200')
+        assert(client.requests[0][1] == {'Accept-Datetime': 'Fri, 01 Jan 2016 23:59:59 GMT'})
+
+        # load timemap
+        res, errs = agg(dict(url='http://example.com/'))
+        assert(len(list(res)) == 2)
+
+        # closest computed locally
+        res, errs = agg(dict(url='http://example.com/', closest='20160101', limit='1'))
+        assert(key_ts_res(res, 'timestamp') == 'com,example)/ 20160225042329 20160225042329')
+
+        res, errs = agg(dict(url='http://example.com/', closest='2014', limit='1'))
+        assert(key_ts_res(res, 'timestamp') == 'com,example)/ 20140127171200 20140127171200')
+
+        assert(len(client.requests) == 2)
+
+        # stale, back to timegate
+        timemap_cache.ttl = 0
+        timemap_cache.put('http://archive.example.com/web/timemap/link/http://example.com/', None)
+        client.responses.append(FakeResponse(200, {'Link': timegate_link}))
+        res, errs = agg(dict(url='http://example.com/', closest='20160101', limit='1'))
+        assert(key_ts_res(res, 'timestamp') == 'com,example)/ 20140127171200 20140127171200')
+        assert(len(client.requests) == 3)
+
+    def test_timemap_cache_prefetch(self):
+        client = FakeClient([FakeResponse(200, {}, TIMEMAP)])
+
+        source = MementoIndexSource.from_timegate_url('http://archive.example.com/web/',
+                                                      client=client,
+                                                      timemap_cache=TimemapCache(),
+                                                      prefetch_timemap=True)
+
+        agg = SimpleAggregator({'source': source})
+
+        for closest in ('2014', '2016', '2015'):
+            res, errs = agg(dict(url='http://example.com/', closest=closest))
+            assert(len(list(res)) == 2)
+
+        assert(len(client.requests) == 1)
+        assert(client.requests[0][0] == 'http://archive.example.com/web/timemap/link/http://example.com/')
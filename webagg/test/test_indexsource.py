@@ -1,7 +1,9 @@
 from webagg.indexsource import FileIndexSource, RemoteIndexSource, MementoIndexSource, RedisIndexSource
 from webagg.indexsource import LiveIndexSource
+from webagg.indexsource import iter_closest_range
 
 from webagg.aggregator import SimpleAggregator
+from webagg.utils import MementoUtils, MementoException
 
 from pywb.utils.timeutils import timestamp_now
 
@@ -9,6 +11,10 @@ from .testutils import key_ts_res
 
 
 import pytest
+import tempfile
+import os
+
+from io import BytesIO
 
 from fakeredis import FakeStrictRedis
 from mock import patch
@@ -87,6 +93,113 @@ org,iana)/_css/2013.1/fonts/inconsolata.otf 20140126200826 iana.warc.gz"""
     assert(errs == {})
 
 
+# Closest -- Window Seek
+# ============================================================================
+def _many_captures_index():
+    lines = [b'com,example)/a 20140101000000 {}']
+    for i in range(500):
+        lines.append('com,example)/many 2014{0:010d} {{"i": {0}}}'.format(i * 7).encode('utf-8'))
+    lines.append(b'com,example)/z 20140101000000 {}')
+    return lines
+
+
+@pytest.mark.parametrize("closest,window", [('20140000001400', 5),
+                                            ('20140000003497', 3),
+                                            ('20140000000000', 10),
+                                            ('20150101', 50),
+                                            ('2013', 1000)])
+def test_iter_closest_range(closest, window):
+    lines = _many_captures_index()
+    reader = BytesIO(b'\n'.join(lines) + b'\n')
+
+    start = b'com,example)/many'
+    end = b'com,example)/many!'
+    closest_key = start + b' ' + closest.encode('utf-8')
+
+    res = list(iter_closest_range(reader, start, end, closest_key, window, block_size=64))
+
+    in_range = [line for line in lines if start <= line < end]
+    before = [line for line in in_range if line < closest_key]
+    after = [line for line in in_range if line >= closest_key]
+
+    assert(res == before[-window:] + after)
+
+
+def test_file_closest_window_same_as_full():
+    lines = _many_captures_index()
+    with tempfile.NamedTemporaryFile(suffix='.cdxj', delete=False) as fh:
+        fh.write(b'\n'.join(lines) + b'\n')
+
+    try:
+        full = FileIndexSource(fh.name, closest_window=0)
+        windowed = FileIndexSource(fh.name, closest_window=4)
+
+        for limit in (1, 4, 10):
+            params = dict(url='http://example.com/many', closest='20140000001750', limit=limit)
+            res_full, _ = query_single_source(full, dict(params))
+            res_window, _ = query_single_source(windowed, dict(params))
+
+            assert(key_ts_res(res_window, 'timestamp') == key_ts_res(res_full, 'timestamp'))
+
+        # prefix queries always read full range
+        assert(windowed.get_closest_window(dict(closest='2014', matchType='prefix')) == 0)
+        assert(windowed.get_closest_window(dict(closest='2014', filter='=mime:text/html')) == 0)
+        assert(windowed.get_closest_window(dict(closest='2014', limit='20')) == 20)
+    finally:
+        os.remove(fh.name)
+
+
+# Link Format -- Incremental Parse
+# ============================================================================
+LINKS = u"""\
+<http://example.com/>; rel="original",
+<http://archive.example.com/timemap/http://example.com/>; rel="self"; type="application/link-format"; from="Mon, 27 Jan 2014 17:12:00 GMT",
+<http://archive.example.com/20140127171200/http://example.com/?a=b,c>; rel="first memento"; datetime="Mon, 27 Jan 2014 17:12:00 GMT",
+<http://archive.example.com/20160225042329/http://example.com/\u00e9>;rel=memento;datetime="Thu, 25 Feb 2016 04:23:29 GMT"
+"""
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 64, 10000])
+def test_iter_links_chunked(chunk_size):
+    data = LINKS.encode('utf-8')
+    chunks = [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+
+    res = list(MementoUtils.iter_links(chunks))
+
+    assert(res == list(MementoUtils.iter_links(LINKS)))
+    assert([key for key, _ in res] == ['original', 'timemap', 'memento', 'memento'])
+    assert(res[1][1]['from'] == 'Mon, 27 Jan 2014 17:12:00 GMT')
+    assert(res[2][1] == {'url': 'http://archive.example.com/20140127171200/http://example.com/?a=b,c',
+                         'rel': 'first memento',
+                         'datetime': 'Mon, 27 Jan 2014 17:12:00 GMT'})
+    assert(res[3][1]['url'] == u'http://archive.example.com/20160225042329/http://example.com/\u00e9')
+    assert(res[3][1]['rel'] == 'memento')
+
+    links = MementoUtils.parse_links(LINKS)
+    assert(links['original']['url'] == 'http://example.com/')
+    assert(len(links['mementos']) == 2)
+
+
+def test_iter_links_invalid():
+    with pytest.raises(MementoException):
+        MementoUtils.parse_links('<http://example.com/>; rel="original", http://example.com/; rel="memento"')
+
+
+def test_make_timemap():
+    cdxs = [dict(load_url='http://example.com/1', timestamp='20140127171200', source='a'),
+            dict(filename='b.warc.gz', offset='10', length='20', timestamp='20160225042329')]
+
+    assert(''.join(MementoUtils.make_timemap(iter(cdxs))) == """\
+<http://example.com/1>; rel="memento"; datetime="Mon, 27 Jan 2014 17:12:00 GMT"; src="a",
+<file://b.warc.gz:10:20>; rel="memento"; datetime="Thu, 25 Feb 2016 04:23:29 GMT"; src=""
+""")
+
+    assert(list(MementoUtils.make_timemap(iter([]))) == [])
+
+    # round-trip
+    links = MementoUtils.parse_links(''.join(MementoUtils.make_timemap(iter(cdxs))))
+    assert([mem['url'] for mem in links['mementos']] == ['http://example.com/1', 'file://b.warc.gz:10:20'])
+
+
 # Prefix -- Local Loaders
 # ============================================================================
 @pytest.mark.parametrize("source", local_sources, ids=["file", "redis"])
@@ -0,0 +1,100 @@
+from webagg.handlers import DefaultResourceHandler
+from webagg.indexsource import FileIndexSource
+from webagg.aggregator import SimpleAggregator
+from webagg.app import ResAggApp
+from webagg.responseloader import CachingLoader
+from webagg.recordcache import RecordCache
+
+from .testutils import to_path, TempDirTests, BaseTestClass
+
+import webtest
+import os
+
+
+# ============================================================================
+class TestRecordCache(TempDirTests, BaseTestClass):
+    @classmethod
+    def setup_class(cls):
+        super(TestRecordCache, cls).setup_class()
+
+        source = SimpleAggregator({'example': FileIndexSource(to_path('testdata/example.cdxj'))})
+
+        cls.cache_dir = os.path.join(cls.root_dir, 'records')
+        cls.cache = RecordCache(cache_dir=cls.cache_dir)
+        cls.handler = DefaultResourceHandler(source, to_path('testdata/'),
+                                             record_cache=cls.cache)
+
+        app = ResAggApp()
+        app.add_route('/nocache', DefaultResourceHandler(source, to_path('testdata/')))
+        app.add_route('/cache', cls.handler)
+        cls.testapp = webtest.TestApp(app)
+
+    def test_cached_same_as_loaded(self):
+        for url in ('http://example.com/', 'http://www.example.com/'):
+            expected = self.testapp.get('/nocache/resource', params={'url': url})
+
+            for i in range(3):
+                resp = self.testapp.get('/cache/resource', params={'url': url})
+                assert resp.body == expected.body
+                assert resp.headers['Memento-Datetime'] == expected.headers['Memento-Datetime']
+                assert resp.headers['WebAgg-Source-Coll'] == 'example'
+
+        # same record, admitted on second request
+        assert len(self.cache.mem_cache) == 1
+        assert len(os.listdir(self.cache_dir)) == 1
+
+        assert isinstance(self.handler.resource_loaders[0], CachingLoader)
+        out_headers, res, errs = self.handler(dict(url='http://example.com/', mode='resource'))
+        assert isinstance(res, list)
+        out_headers['Server-Timing'] = 'test'
+        assert 'Server-Timing' not in list(self.cache.mem_cache.values())[0][0]
+
+    def test_disk_tier(self):
+        self.testapp.get('/cache/resource', params={'url': 'http://example.com/'})
+        self.testapp.get('/cache/resource', params={'url': 'http://example.com/'})
+
+        cache = RecordCache(cache_dir=self.cache_dir)
+        assert len(cache.mem_cache) == 0
+        key = list(cache.disk_entries.keys())[0]
+        headers, record = cache.get(key)
+        assert record.startswith(b'WARC/1.0\r\n')
+        assert headers['Content-Length'] == str(len(record))
+        assert key in cache.mem_cache
+
+    def test_admission_and_size(self):
+        cache = RecordCache(max_mem_size=100, max_item_size=60)
+
+        # not yet requested
+        assert not cache.put('a', {}, b'a' * 50)
+
+        for i in range(3):
+            cache.get('a')
+        assert cache.put('a', {}, b'a' * 50)
+
+        # too large
+        cache.get('b')
+        cache.get('b')
+        assert not cache.put('b', {}, b'b' * 70)
+
+        # would evict more frequently requested 'a'
+        assert not cache.put('b', {}, b'b' * 60)
+        assert cache.get('a') == ({}, b'a' * 50)
+
+        # fits without eviction
+        cache.get('c')
+        cache.get('c')
+        assert cache.put('c', {}, b'c' * 40)
+        assert cache.mem_size == 90
+
+        # evicts lru 'a', requested less often
+        for i in range(6):
+            cache.get('d')
+        assert cache.put('d', {}, b'd' * 50)
+        assert list(cache.mem_cache.keys()) == ['c', 'd']
+
+        # counts halved
+        cache = RecordCache(sample_size=4)
+        for i in range(3):
+            cache.get('a')
+        cache.get('b')
+        assert cache.freq == {'a': 1}
@@ -0,0 +1,74 @@
+from webagg.responseloader import RedisResolver
+
+from .testutils import FakeRedisTests, BaseTestClass
+
+import redis
+import time
+
+
+# ============================================================================
+class TestRedisResolver(FakeRedisTests, BaseTestClass):
+    @classmethod
+    def setup_class(cls):
+        super(TestRedisResolver, cls).setup_class()
+        cls.redis = redis.StrictRedis.from_url('redis://localhost/2')
+
+    def publish(self, file_key, filename, path):
+        self.redis.hset(file_key, filename, path)
+        self.redis.publish(RedisResolver.UPDATE_CHANNEL,
+                           RedisResolver.make_update(file_key, filename))
+
+    def test_wildcard_keys(self):
+        self.redis.hset('wild:a:warc', 'file1.warc.gz', '/a/file1.warc.gz')
+        self.redis.hset('wild:b:warc', 'file2.warc.gz', '/b/file2.warc.gz')
+
+        resolver = RedisResolver('redis://localhost/2/wild:*:warc')
+
+        assert resolver('file2.warc.gz', {}) == '/b/file2.warc.gz'
+        assert resolver('file1.warc.gz', {}) == '/a/file1.warc.gz'
+        assert resolver('file3.warc.gz', {}) is None
+        assert resolver.key_sets['wild:*:warc'][0] == ['wild:a:warc', 'wild:b:warc']
+
+        # new key published
+        self.publish('wild:c:warc', 'file3.warc.gz', '/c/file3.warc.gz')
+        assert resolver('file3.warc.gz', {}) == '/c/file3.warc.gz'
+
+        # new key not published, found once keys are rescanned
+        self.redis.hset('wild:d:warc', 'file4.warc.gz', '/d/file4.warc.gz')
+        assert resolver('file4.warc.gz', {}) is None
+
+        resolver.key_sets['wild:*:warc'][1] = 0
+        assert resolver('file4.warc.gz', {}) is None
+
+        while resolver.refreshing:
+            time.sleep(0.01)
+
+        assert resolver('file4.warc.gz', {}) == '/d/file4.warc.gz'
+
+    def test_cached_paths(self):
+        self.redis.hset('cached:warc', 'file1.warc.gz', '/a/file1.warc.gz')
+
+        resolver = RedisResolver('redis://localhost/2/cached:warc', ttl=60)
+        assert resolver('file1.warc.gz', {}) == '/a/file1.warc.gz'
+
+        # not published, still cached
+        self.redis.hset('cached:warc', 'file1.warc.gz', '/b/file1.warc.gz')
+        assert resolver('file1.warc.gz', {}) == '/a/file1.warc.gz'
+
+        self.publish('cached:warc', 'file1.warc.gz', '/c/file1.warc.gz')
+        assert resolver('file1.warc.gz', {}) == '/c/file1.warc.gz'
+
+        # expired
+        self.redis.hset('cached:warc', 'file1.warc.gz', '/d/file1.warc.gz')
+        resolver.paths[('cached:warc', 'file1.warc.gz')] = ('/c/file1.warc.gz', 0)
+        assert resolver('file1.warc.gz', {}) == '/d/file1.warc.gz'
+
+    def test_not_cached_by_default(self):
+        self.redis.hset('default:warc', 'file1.warc.gz', '/a/file1.warc.gz')
+
+        resolver = RedisResolver('redis://localhost/2/default:warc')
+        assert resolver('file1.warc.gz', {}) == '/a/file1.warc.gz'
+
+        self.redis.hdel('default:warc', 'file1.warc.gz')
+        assert resolver('file1.warc.gz', {}) is None
+        assert resolver.pubsub is None
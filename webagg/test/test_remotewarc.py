@@ -0,0 +1,129 @@
+from webagg.handlers import DefaultResourceHandler
+from webagg.indexsource import FileIndexSource
+from webagg.aggregator import SimpleAggregator
+from webagg.app import ResAggApp
+from webagg.remotewarc import RemoteWARCStore, BlockCache
+
+from .testutils import to_path, TempDirTests, BaseTestClass, ServerThreadRunner
+
+import webtest
+import requests
+import pytest
+import os
+import re
+
+
+# ============================================================================
+def range_file_app(environ, start_response):
+    """ Stand-in for WARC object storage: serves testdata/ with
+    Range support and counts requests
+    """
+    path = environ['PATH_INFO']
+    if path == '/_count':
+        start_response('200 OK', [('Content-Type', 'text/plain')])
+        return [str(range_file_app.count).encode('utf-8')]
+
+    range_file_app.count += 1
+
+    try:
+        with open(to_path('testdata' + path), 'rb') as fh:
+            content = fh.read()
+    except IOError:
+        start_response('404 Not Found', [])
+        return [b'']
+
+    m = re.match(r'bytes=(\d+)-(\d+)', environ.get('HTTP_RANGE', ''))
+    if not m:
+        start_response('200 OK', [('Content-Length', str(len(content)))])
+        return [content]
+
+    start, end = int(m.group(1)), int(m.group(2)) + 1
+    if start >= len(content):
+        start_response('416 Range Not Satisfiable', [])
+        return [b'']
+
+    content = content[start:end]
+    start_response('206 Partial Content', [('Content-Length', str(len(content)))])
+    return [content]
+
+range_file_app.count = 0
+
+
+# ============================================================================
+class TestRemoteWARC(TempDirTests, BaseTestClass):
+    @classmethod
+    def setup_class(cls):
+        super(TestRemoteWARC, cls).setup_class()
+        cls.server = ServerThreadRunner(range_file_app)
+        cls.base_url = 'http://localhost:{0}/'.format(cls.server.port)
+
+        source = SimpleAggregator({'example': FileIndexSource(to_path('testdata/example.cdxj'))})
+
+        cls.cache_dir = os.path.join(cls.root_dir, 'blocks')
+        cls.store = RemoteWARCStore(cache=BlockCache(cache_dir=cls.cache_dir),
+                                    block_size=1024)
+
+        app = ResAggApp()
+        app.add_route('/local', DefaultResourceHandler(source, to_path('testdata/')))
+        app.add_route('/remote', DefaultResourceHandler(source, cls.base_url, cls.store))
+        cls.testapp = webtest.TestApp(app)
+
+    @classmethod
+    def teardown_class(cls):
+        cls.server.stop()
+        super(TestRemoteWARC, cls).teardown_class()
+
+    def get_count(self):
+        return int(requests.get(self.base_url + '_count').text)
+
+    def test_remote_same_as_local(self):
+        for url in ('http://example.com/', 'http://www.example.com/'):
+            resp_local = self.testapp.get('/local/resource', params={'url': url})
+
+            count = self.get_count()
+            resp = self.testapp.get('/remote/resource', params={'url': url})
+            assert resp.body == resp_local.body
+
+            # cached
+            after = self.get_count()
+            resp = self.testapp.get('/remote/resource', params={'url': url})
+            assert resp.body == resp_local.body
+            assert self.get_count() == after
+
+        assert self.get_count() > 0
+
+    def test_adjacent_blocks_single_request(self):
+        store = RemoteWARCStore(cache=BlockCache(), block_size=100)
+        url = self.base_url + 'example.warc.gz'
+
+        with open(to_path('testdata/example.warc.gz'), 'rb') as fh:
+            expected = fh.read()
+
+        count = self.get_count()
+        assert store.read_range(url, 150, 420) == expected[150:420]
+        assert self.get_count() == count + 1
+
+        # only the missing blocks are requested
+        assert store.read_range(url, 50, 550) == expected[50:550]
+        assert self.get_count() == count + 3
+
+        # past end of file
+        reader = store.open(url, len(expected) - 10)
+        assert reader.read() == expected[-10:]
+        assert reader.read() == b''
+
+    def test_disk_tier(self):
+        self.testapp.get('/remote/resource', params={'url': 'http://example.com/'})
+        assert len(os.listdir(self.cache_dir)) > 0
+
+        # new store, blocks loaded from disk
+        store = RemoteWARCStore(cache=BlockCache(cache_dir=self.cache_dir), block_size=1024)
+        count = self.get_count()
+        reader = store.open(self.base_url + 'example.warc.gz', 363, 1286)
+        assert len(reader.read()) == 1286
+        assert self.get_count() == count
+
+    def test_remote_not_found(self):
+        reader = self.store.open(self.base_url + 'not-found.warc.gz', 0, 100)
+        with pytest.raises(IOError):
+            reader.read()
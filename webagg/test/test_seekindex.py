@@ -0,0 +1,115 @@
+from webagg.handlers import DefaultResourceHandler
+from webagg.indexsource import FileIndexSource
+from webagg.aggregator import SimpleAggregator
+from webagg.app import ResAggApp
+from webagg.seekindex import SeekIndexCache
+
+from pywb.warc.cdxindexer import write_cdx_index
+from pywb.utils.statusandheaders import StatusAndHeadersParser
+
+from .testutils import TempDirTests, BaseTestClass
+
+from io import BytesIO
+
+import webtest
+import random
+import gzip
+import os
+
+
+# ============================================================================
+def make_record(payload):
+    http_headers = (b'HTTP/1.1 200 OK\r\n' +
+                    b'Content-Type: video/mp4\r\n' +
+                    b'Content-Length: ' + str(len(payload)).encode('utf-8') + b'\r\n\r\n')
+
+    block = http_headers + payload
+
+    warc_headers = (b'WARC/1.0\r\n' +
+                    b'WARC-Type: response\r\n' +
+                    b'WARC-Record-ID: <urn:uuid:12345678-feb0-11e6-8f83-68a86d1772ce>\r\n' +
+                    b'WARC-Target-URI: http://example.com/video.mp4\r\n' +
+                    b'WARC-Date: 2016-02-25T04:23:29Z\r\n' +
+                    b'Content-Type: application/http; msgtype=response\r\n' +
+                    b'Content-Length: ' + str(len(block)).encode('utf-8') + b'\r\n\r\n')
+
+    return warc_headers + block + b'\r\n\r\n'
+
+
+# ============================================================================
+class TestSeekIndex(TempDirTests, BaseTestClass):
+    @classmethod
+    def setup_class(cls):
+        super(TestSeekIndex, cls).setup_class()
+
+        rand = random.Random(1234)
+        cls.payload = bytes(bytearray(rand.getrandbits(8) for i in range(1024 * 1024)))
+
+        record = make_record(cls.payload)
+
+        with open(os.path.join(cls.root_dir, 'video.warc.gz'), 'wb') as fh:
+            fh.write(gzip.compress(record))
+
+        with open(os.path.join(cls.root_dir, 'video.warc'), 'wb') as fh:
+            fh.write(record)
+
+        app = ResAggApp()
+        cls.seek_indexes = SeekIndexCache(spacing=100000)
+
+        for name in ('video.warc.gz', 'video.warc'):
+            cdx_path = os.path.join(cls.root_dir, name + '.cdxj')
+            with open(os.path.join(cls.root_dir, name), 'rb') as fh:
+                with open(cdx_path, 'wb') as out:
+                    write_cdx_index(out, fh, name, cdxj=True)
+
+            source = SimpleAggregator({'video': FileIndexSource(cdx_path)})
+            handler = DefaultResourceHandler(source, cls.root_dir + os.path.sep,
+                                             seek_indexes=cls.seek_indexes)
+
+            app.add_route('/' + name.replace('.', '_'), handler)
+
+        cls.testapp = webtest.TestApp(app)
+
+    def get_range(self, route, range_):
+        resp = self.testapp.get(route + '/resource', params={'url': 'http://example.com/video.mp4'},
+                                headers={'Range': range_})
+
+        stream = BytesIO(resp.body)
+        parser = StatusAndHeadersParser([], verify=False)
+        warc_headers = parser.parse(stream)
+        http_headers = parser.parse(stream)
+        body = stream.read()
+
+        assert warc_headers.get_header('Content-Length') == str(len(resp.body) - len(warc_headers.to_bytes()))
+        assert http_headers.get_header('Content-Length') == str(len(body))
+        return http_headers, body
+
+    def test_range_gzip(self):
+        http_headers, body = self.get_range('/video_warc_gz', 'bytes=700000-700099')
+
+        assert http_headers.statusline == '206 Partial Content'
+        assert http_headers.get_header('Content-Range') == 'bytes 700000-700099/1048576'
+        assert body == self.payload[700000:700100]
+
+        # checkpoints added up to range
+        index = list(self.seek_indexes.cache.values())[0]
+        assert len(index.out_points) > 5
+        assert index.out_points[-1] <= 700000 + 2 * 65536 + 1000
+
+        # resume from checkpoint
+        http_headers, body = self.get_range('/video_warc_gz', 'bytes=300000-')
+        assert http_headers.get_header('Content-Range') == 'bytes 300000-1048575/1048576'
+        assert body == self.payload[300000:]
+
+    def test_range_plain(self):
+        http_headers, body = self.get_range('/video_warc', 'bytes=1000-1999')
+
+        assert http_headers.statusline == '206 Partial Content'
+        assert body == self.payload[1000:2000]
+
+    def test_no_range(self):
+        resp = self.testapp.get('/video_warc_gz/resource', params={'url': 'http://example.com/video.mp4'},
+                                headers={'Range': 'bytes=2000000-'})
+
+        assert b'HTTP/1.1 200 OK' in resp.body
+        assert resp.body.endswith(self.payload)
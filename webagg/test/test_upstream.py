@@ -1,4 +1,5 @@
 import webtest
+import json
 
 from io import BytesIO
 from webagg.app import ResAggApp
@@ -7,6 +8,7 @@ import requests
 from webagg.handlers import DefaultResourceHandler
 from webagg.aggregator import SimpleAggregator
 from webagg.proxyindexsource import ProxyMementoIndexSource, UpstreamAggIndexSource
+from webagg.httpclient import RemoteHttpClient, DNSCache, DNSCacheHTTPConnectionPool
 
 from pywb.warc.recordloader import ArcWarcRecordLoader
 
@@ -42,6 +44,43 @@ class TestUpstream(LiveServerTests, BaseTestClass):
         res = self.testapp.get('/')
         assert set(res.json.keys()) == {'/upstream/postreq', '/upstream', '/upstream_opt', '/upstream_opt/postreq'}
 
+    def test_upstream_index(self):
+        resp = self.testapp.get('/upstream/index?url=http://httpbin.org/get&output=json')
+        cdxlist = [json.loads(line) for line in resp.text.rstrip().split('\n')]
+
+        assert len(cdxlist) == 1
+        assert cdxlist[0]['source'] == 'upstream:live'
+        assert cdxlist[0]['url'] == 'http://httpbin.org/get'
+        assert cdxlist[0]['filename'] == self.base_url + '/live/resource?url=http://httpbin.org/get&closest=' + cdxlist[0]['timestamp']
+
+    def test_upstream_index_pooled(self):
+        client = RemoteHttpClient(max_hosts=2, max_per_host=1, block=True)
+        source = UpstreamAggIndexSource(self.base_url + '/live', client=client)
+        agg = SimpleAggregator({'upstream': source})
+
+        for i in range(3):
+            cdx_iter, errs = agg({'url': 'http://example.com/'})
+            cdxlist = list(cdx_iter)
+            assert len(cdxlist) == 1
+            assert errs == {}
+
+        # all requests reused the single pooled connection
+        pools = client.session.get_adapter(self.base_url).poolmanager.pools
+        assert len(pools) == 1
+        pool = pools[list(pools.keys())[0]]
+        assert isinstance(pool, DNSCacheHTTPConnectionPool)
+        assert pool.num_connections == 1
+        assert pool.num_requests == 3
+
+    def test_dns_cache(self):
+        cache = DNSCache(ttl=60, max_size=2)
+        assert cache.resolve('localhost', 80) in ('127.0.0.1', '::1')
+        assert 'localhost' in cache.cache
+
+        cache.resolve('127.0.0.1', 80)
+        cache.resolve('127.0.0.2', 80)
+        assert list(cache.cache.keys()) == ['127.0.0.1', '127.0.0.2']
+
     def test_live_1(self):
         resp = requests.get(self.base_url + '/live/resource?url=http://httpbin.org/get', stream=True)
         assert resp.headers['WebAgg-Source-Coll'] == 'live'
@@ -0,0 +1,51 @@
+from webagg.utils import ParamFormatter, TemplateCache, res_template
+
+import pytest
+
+
+# ============================================================================
+@pytest.mark.parametrize("template", ['{url}',
+                                      'http://example.com/{coll}/{timestamp}id_/{url}',
+                                      'redis://localhost/2/{user}:{coll}:cdxj',
+                                      '{{literal}} {url}',
+                                      'no fields',
+                                      ''])
+def test_compiled_same_as_formatter(template):
+    params = {'url': 'http://example.com/', 'param.coll': 'A',
+              'param.src.coll': 'B', 'param.user': 'FOO'}
+
+    render = TemplateCache().get(template)
+    assert(render is not None)
+
+    for name in ('', 'src'):
+        formatter = ParamFormatter(params, name)
+        expected = super(ParamFormatter, formatter).format(template,
+                                                           url=params['url'],
+                                                           timestamp=20140101)
+
+        assert(formatter.format(template, url=params['url'], timestamp=20140101) == expected)
+
+
+def test_not_compiled():
+    cache = TemplateCache()
+    assert(cache.get('{0}') is None)
+    assert(cache.get('{url!r}') is None)
+    assert(cache.get('{url:>10}') is None)
+    assert(cache.get('{url.lower}') is None)
+    assert(cache.get('{url') is None)
+
+    formatter = ParamFormatter({})
+    assert(formatter.format('{url:>5}', url='a') == '    a')
+
+    with pytest.raises(ValueError):
+        formatter.format('{url')
+
+
+def test_res_template_params():
+    params = {'url': 'http://example.com/', 'param.coll': 'A', 'param.local.coll': 'B'}
+    assert(res_template('{coll}/{url}', params) == 'A/http://example.com/')
+
+    params['_formatter'] = ParamFormatter(params, 'local')
+    assert(res_template('{coll}/{url}', params) == 'B/http://example.com/')
+    assert(res_template('{other}/{x}', params, x=1) == '/1')
+    assert(params['_formatter'].resolved == {'coll': 'B', 'url': None, 'other': None, 'x': None})
@@ -1,18 +1,21 @@
 import re
 import six
+import codecs
 import string
 import yaml
 import os
 
 from contextlib import closing
 
-from pywb.utils.timeutils import timestamp_to_http_date
 from pywb.utils.wbexception import BadRequestException
 
-LINK_SPLIT = re.compile(',\s*(?=[<])')
-LINK_SEG_SPLIT = re.compile(';\s*')
-LINK_URL = re.compile('<(.*)>')
-LINK_PROP = re.compile('([\w]+)="([^"]+)')
+from webagg.dateutils import timestamp_to_http_date
+
+# a single link, including the trailing comma separator
+LINK_ENTRY = re.compile(r'\s*<([^>]*)>((?:[^,"]|"[^"]*")*),')
+LINK_PARAM = re.compile(r';\s*([^;,=\s]+)\s*=\s*(?:"([^"]*)"|([^;,\s]*))')
+
+MEMENTO_LINK = '<%s>; rel="%s"; datetime="%s"; src="%s"'
 
 BUFF_SIZE = 16384
 
@@ -25,44 +28,77 @@ class MementoException(BadRequestException):
 #=============================================================================
 class MementoUtils(object):
     @staticmethod
-    def parse_links(link_header, def_name='timemap'):
-        links = LINK_SPLIT.split(link_header)
-        results = {}
-        mementos = []
+    def iter_links(chunks, def_name='timemap'):
+        """ Incrementally parse Link-format text, from a string or an
+        iterable of text or bytes chunks, yielding (key, result) for each
+        link as soon as it is complete
+
+        key is 'memento' for any memento rel, 'def_name' for rel="self",
+        otherwise the rel value. result is a dict of url and all props,
+        rel is only kept for mementos
+        """
+        if isinstance(chunks, (six.text_type, six.binary_type)):
+            chunks = [chunks]
+
+        decoder = codecs.getincrementaldecoder('utf-8')('replace')
+
+        buff = ''
+        pos = 0
+        done = False
+        chunks = iter(chunks)
+
+        while not done:
+            try:
+                chunk = next(chunks)
+                if isinstance(chunk, six.binary_type):
+                    chunk = decoder.decode(chunk)
+            except StopIteration:
+                # final link has no trailing comma
+                chunk = decoder.decode(b'', True) + ','
+                done = True
+
+            buff = buff[pos:] + chunk
+            pos = 0
+
+            while True:
+                m = LINK_ENTRY.match(buff, pos)
+                if not m:
+                    break
 
-        for link in links:
-            props = LINK_SEG_SPLIT.split(link)
-            m = LINK_URL.match(props[0])
-            if not m:
-                raise MementoException('Invalid Link Url: ' + props[0])
+                pos = m.end()
 
-            result = dict(url=m.group(1))
-            key = ''
-            is_mem = False
+                result = {'url': m.group(1)}
 
-            for prop in props[1:]:
-                m = LINK_PROP.match(prop)
-                if not m:
-                    raise MementoException('Invalid prop ' + prop)
+                for name, quoted, value in LINK_PARAM.findall(m.group(2)):
+                    result[name] = quoted or value
 
-                name = m.group(1)
-                value = m.group(2)
+                key = result.get('rel')
+                if not key:
+                    continue
 
-                if name == 'rel':
-                    if 'memento' in value:
-                        is_mem = True
-                        result[name] = value
-                    elif value == 'self':
-                        key = def_name
-                    else:
-                        key = value
+                if 'memento' in key:
+                    key = 'memento'
                 else:
-                    result[name] = value
+                    del result['rel']
+                    if key == 'self':
+                        key = def_name
 
-            if key:
-                results[key] = result
-            elif is_mem:
+                yield key, result
+
+        rest = buff[pos:].strip(', \t\r\n')
+        if rest:
+            raise MementoException('Invalid Link: ' + rest[:100])
+
+    @staticmethod
+    def parse_links(link_header, def_name='timemap'):
+        results = {}
+        mementos = []
+
+        for key, result in MementoUtils.iter_links(link_header, def_name):
+            if key == 'memento':
                 mementos.append(result)
+            else:
+                results[key] = result
 
         results['mementos'] = mementos
         return results
@@ -73,42 +109,98 @@ class MementoUtils(object):
         if not url:
             url = 'file://{0}:{1}:{2}'.format(cdx.get('filename'), cdx.get('offset'), cdx.get('length'))
 
-        memento = '<{0}>; rel="{1}"; datetime="{2}"; src="{3}"' + end
-
         if not datetime:
             datetime = timestamp_to_http_date(cdx['timestamp'])
 
-        return memento.format(url, rel, datetime, cdx.get('source', ''))
-
+        return MEMENTO_LINK % (url, rel, datetime, cdx.get('source', '')) + end
 
     @staticmethod
     def make_timemap(cdx_iter):
-        # get first memento as it'll be used for 'from' field
-        try:
-            first_cdx = six.next(cdx_iter)
-            from_date = timestamp_to_http_date(first_cdx['timestamp'])
-        except StopIteration:
-            first_cdx = None
-            return
-
-        # first memento link
-        yield MementoUtils.make_timemap_memento_link(first_cdx, datetime=from_date)
-
-        prev_cdx = None
+        # each memento link is emitted with the separator for the previous one
+        end = ''
 
         for cdx in cdx_iter:
-            if prev_cdx:
-                yield MementoUtils.make_timemap_memento_link(prev_cdx)
-
-            prev_cdx = cdx
+            yield end + MementoUtils.make_timemap_memento_link(cdx, end='')
+            end = ',\n'
 
         # last memento link, if any
-        if prev_cdx:
-            yield MementoUtils.make_timemap_memento_link(prev_cdx, end='\n')
+        if end:
+            yield '\n'
 
     @staticmethod
     def make_link(url, type):
-        return '<{0}>; rel="{1}"'.format(url, type)
+        return '<' + url + '>; rel="' + type + '"'
+
+
+#=============================================================================
+class TemplateCache(object):
+    """ Templates compiled once into a render function over the parsed
+    literal text and field names, or None if the template uses features
+    (positional fields, attributes, conversions, format specs) that are
+    left to string.Formatter
+    """
+    FIELD_NAME = re.compile(r'^[A-Za-z_]\w*$')
+
+    def __init__(self, max_size=1000):
+        self.max_size = max_size
+        self.templates = {}
+
+    def get(self, template):
+        try:
+            return self.templates[template]
+        except KeyError:
+            pass
+
+        compiled = self.compile(template)
+
+        if len(self.templates) >= self.max_size:
+            self.templates.clear()
+
+        self.templates[template] = compiled
+        return compiled
+
+    def compile(self, template):
+        parts = []
+
+        try:
+            parsed = list(string.Formatter().parse(template))
+        except ValueError:
+            return None
+
+        for literal, field_name, format_spec, conversion in parsed:
+            if field_name is not None:
+                if (format_spec or conversion or
+                    not self.FIELD_NAME.match(field_name)):
+                    return None
+
+            parts.append((literal, field_name))
+
+        field_names = tuple(field for _, field in parts if field is not None)
+
+        if not field_names:
+            text = ''.join(literal for literal, _ in parts)
+            return lambda get_value, kwargs: text
+
+        def render(get_value, kwargs):
+            buff = []
+            for literal, field_name in parts:
+                if literal:
+                    buff.append(literal)
+
+                if field_name is not None:
+                    value = get_value(field_name, (), kwargs)
+                    if not isinstance(value, six.string_types):
+                        value = format(value, '')
+
+                    buff.append(value)
+
+            return ''.join(buff)
+
+        render.field_names = field_names
+        return render
+
+
+TEMPLATES = TemplateCache()
 
 
 #=============================================================================
@@ -118,17 +210,37 @@ class ParamFormatter(string.Formatter):
         self.prefix = prefix
         self.name = name
 
-    def get_value(self, key, args, kwargs):
+        # per-request view of resolved 'param.' values, by key
+        self.resolved = {}
+
+    def format(self, format_string, *args, **kwargs):
+        render = TEMPLATES.get(format_string)
+        if render is None or args:
+            return super(ParamFormatter, self).format(format_string, *args, **kwargs)
+
+        return render(self.get_value, kwargs)
+
+    def resolve_param(self, key):
+        try:
+            return self.resolved[key]
+        except KeyError:
+            pass
+
+        value = None
+
         # First, try the named param 'param.{name}.{key}'
         if self.name:
-            named_key = self.prefix + self.name + '.' + key
-            value = self.params.get(named_key)
-            if value is not None:
-                return value
+            value = self.params.get(self.prefix + self.name + '.' + key)
 
         # Then, try 'param.{key}'
-        named_key = self.prefix + key
-        value = self.params.get(named_key)
+        if value is None:
+            value = self.params.get(self.prefix + key)
+
+        self.resolved[key] = value
+        return value
+
+    def get_value(self, key, args, kwargs):
+        value = self.resolve_param(key)
         if value is not None:
             return value
 
@@ -163,6 +275,75 @@ def StreamIter(stream, header1=None, header2=None, size=BUFF_SIZE):
             yield buff
 
 
+#=============================================================================
+class FileRange(object):
+    """ Response body for a byte range of a local file, preceded by
+    an optional header buffer
+
+    Iterating reads the range with positional reads, directly into the
+    output chunks. As a file-like object, positioned at the start of the
+    range, it can also be passed to wsgi.file_wrapper after sending the
+    header, letting the server use sendfile() on fileno()
+    """
+    def __init__(self, filename, offset, length, header=b''):
+        self.filename = filename
+        self.offset = offset
+        self.length = length
+        self.header = header
+
+        self.pos = offset
+        self.end = offset + length
+        self.fh = None
+
+    def _open(self):
+        if not self.fh:
+            self.fh = open(self.filename, 'rb')
+            self.fh.seek(self.offset)
+
+        return self.fh
+
+    def fileno(self):
+        return self._open().fileno()
+
+    def tell(self):
+        return self.pos
+
+    def read(self, size=-1):
+        remaining = self.end - self.pos
+        if size is None or size < 0 or size > remaining:
+            size = remaining
+
+        if size <= 0:
+            return b''
+
+        fh = self._open()
+        if hasattr(os, 'pread'):
+            buff = os.pread(fh.fileno(), size, self.pos)
+        else:  #pragma: no cover
+            fh.seek(self.pos)
+            buff = fh.read(size)
+
+        self.pos += len(buff)
+        return buff
+
+    def close(self):
+        if self.fh:
+            self.fh.close()
+            self.fh = None
+
+    def __iter__(self):
+        with closing(self):
+            if self.header:
+                yield self.header
+
+            while True:
+                buff = self.read(BUFF_SIZE)
+                if not buff:
+                    break
+
+                yield buff
+
+
 #=============================================================================
 def chunk_encode_iter(orig_iter):
     for chunk in orig_iter: